@@ -0,0 +1,134 @@
+import os
+import json
+import hashlib
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlencode
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from metrics import metrics
+from governor import RequestGovernor
+
+API_URL = 'http://search.worldbank.org/api/v2/projects'
+
+
+class ApiError(Exception):
+    """Raised when a page could not be fetched after all retries."""
+
+
+class ResponseCache:
+    """On-disk cache of API responses keyed by request url.
+
+    Stores each body alongside its ETag and Last-Modified headers so later
+    requests can be made conditional, and a 304 served from disk.
+    """
+
+    def __init__(self, directory='.api_cache'):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, url, extension):
+        return os.path.join(self.directory, hashlib.sha1(url.encode()).hexdigest() + extension)
+
+    def get(self, url):
+        """Returns (body, validators) for a cached url, or (None, {})."""
+        try:
+            with open(self._path(url, '.meta'), 'r') as f:
+                validators = json.loads(f.read())
+            with open(self._path(url, '.json'), 'rb') as f:
+                return f.read(), validators
+        except (OSError, ValueError):
+            return None, {}
+
+    def put(self, url, body, headers):
+        validators = { key: headers[key] for key in ('ETag', 'Last-Modified') if headers.get(key) }
+        # the body is written before its validators, so a crash never pairs new validators with an old body
+        for extension, content in (('.json', body), ('.meta', json.dumps(validators).encode())):
+            temp_path = self._path(url, extension) + '.tmp'
+            with open(temp_path, 'wb') as f:
+                f.write(content)
+            os.replace(temp_path, self._path(url, extension))
+
+
+class ProjectsApi:
+    """Pages through the World Bank projects search API with bounded concurrency.
+
+    Pages are requested page_size rows at a time by up to `workers` threads
+    and yielded as they arrive, so callers can merge them without holding the
+    full result set. Requests are retried and rate limited by the given
+    RequestGovernor. Responses are cached on disk and revalidated with
+    If-None-Match/If-Modified-Since, so re-runs only download pages that
+    changed.
+    """
+
+    def __init__(self, url=API_URL, params=None, page_size=500, workers=4, timeout=60, cache=None, governor=None):
+        self.url = url
+        self.params = params if params is not None else { 'format': 'json', 'source': 'IBRD' }
+        self.page_size = page_size
+        self.workers = workers
+        self.timeout = timeout
+        self.cache = cache
+        self.governor = governor if governor is not None else RequestGovernor(retries=5)
+        self.fetched = 0
+        self.not_modified = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def _session(self):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            session.mount('http://', HTTPAdapter(pool_maxsize=2))
+            session.mount('https://', HTTPAdapter(pool_maxsize=2))
+            self._local.session = session
+        return session
+
+    def page_url(self, offset, rows):
+        return f'{self.url}?{urlencode({ **self.params, "rows": rows, "os": offset })}'
+
+    def fetch(self, url):
+        """Fetches a url (or revalidates its cached copy), returning the parsed json body."""
+        cached_body, validators = self.cache.get(url) if self.cache else (None, {})
+        headers = {}
+        if cached_body is not None:
+            if 'ETag' in validators:
+                headers['If-None-Match'] = validators['ETag']
+            if 'Last-Modified' in validators:
+                headers['If-Modified-Since'] = validators['Last-Modified']
+
+        try:
+            get = lambda: self._session().get(url, headers=headers, timeout=self.timeout)
+            response = self.governor.request(url, get, source='api')
+            if response.status_code == 304 and cached_body is not None:
+                with self._lock:
+                    self.not_modified += 1
+                metrics.count('api_pages', status='not_modified')
+                return json.loads(cached_body)
+            response.raise_for_status()
+            data = response.json()
+        except (requests.RequestException, ValueError) as e:
+            raise ApiError(f'Giving up on {url}: {e}')
+        if self.cache:
+            self.cache.put(url, response.content, response.headers)
+        with self._lock:
+            self.fetched += 1
+        metrics.count('api_pages', status='fetched')
+        metrics.count('api_bytes', len(response.content))
+        return data
+
+    def pages(self, number_projects):
+        """Yields the `projects` dict of each page, in completion order, covering up to number_projects projects."""
+        first_rows = min(self.page_size, number_projects)
+        first_page = self.fetch(self.page_url(0, first_rows))
+        yield first_page.get('projects', {})
+
+        total = min(number_projects, int(first_page.get('total', 0) or 0))
+        offsets = range(first_rows, total, self.page_size)
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='api') as executor:
+            futures = [
+                executor.submit(self.fetch, self.page_url(offset, min(self.page_size, total - offset)))
+                for offset in offsets
+            ]
+            for future in as_completed(futures):
+                yield future.result().get('projects', {})
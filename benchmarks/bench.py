@@ -0,0 +1,246 @@
+"""Benchmarks main.py's extraction stages against replayed fixtures, without touching the live site.
+
+Each stage runs main.py's own functions in a fresh process and working
+directory, against a local replay server (see benchmarks/replay.py) serving
+either synthetic fixtures or a recorded fixture directory. For each stage the
+throughput, p50/p99 per-project latency and peak RSS are reported, and the
+results are saved to benchmarks/results so later runs can be compared:
+
+    python -m benchmarks.bench --projects 200
+    python -m benchmarks.bench --projects 200 --stages documents metadata --latency 0.05
+    python -m benchmarks.bench --projects 50 --stages documents api --error-rate 0.2
+    python -m benchmarks.bench --fixtures fixtures/ --compare benchmarks/results/20211001-120000.json
+
+Stages:
+    documents  get_project_documents per project, then waits for downloads
+    metadata   get_project_metadata per project
+    staff      extract_staff_information per project, over a synthetic documents directory
+    xls        transform_xls_to_json over a synthetic xls dump
+    api        fetch_api_data over replayed api pages
+"""
+import os
+import sys
+import csv
+import json
+import time
+import shutil
+import tempfile
+import subprocess
+from datetime import datetime
+from argparse import ArgumentParser, SUPPRESS
+from contextlib import redirect_stdout
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPOSITORY)
+
+from benchmarks.replay import ReplayServer, HOSTS_PREFIX
+from benchmarks.xls_transform import peak_rss_mb
+
+STAGES = ['documents', 'metadata', 'staff', 'xls', 'api']
+RESULTS_DIRECTORY = os.path.join(REPOSITORY, 'benchmarks', 'results')
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+def run_stage(stage, options):
+    """Runs one stage in the current process, which must be in the stage's working directory."""
+    project_ids = options['project_ids']
+    sys.argv = ['main.py', '-tp', 'targets.csv', '--engine', 'http', '--base-url', options['base_url'],
+        '--api-url', options['api_url'], '--staff-workers', '1', '--api-page-size', str(options['api_page_size']),
+        '--rate', '0']
+    latencies = []
+    with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+        import main
+
+        start = time.perf_counter()
+        if stage == 'xls':
+            main.args.filepath = 'dump.xls'
+            main.transform_xls_to_json()
+        elif stage == 'api':
+            main.fetch_api_data(len(project_ids))
+        else:
+            for index, project_id in enumerate(project_ids):
+                project_start = time.perf_counter()
+                if stage == 'documents':
+                    main.get_project_documents(project_id, index, len(project_ids))
+                elif stage == 'metadata':
+                    main.get_project_metadata(project_id)
+                else:
+                    main.extract_staff_information([project_id])
+                latencies.append(time.perf_counter() - project_start)
+            if stage == 'documents':
+                main.persist_completed_downloads(wait=True)
+        main.projects.commit()
+        elapsed = time.perf_counter() - start
+
+        # how many projects the stage actually completed, so a run against missing fixtures can't pass as a fast one
+        if stage in ('documents', 'metadata', 'staff'):
+            completed = len(main.extraction_details['staff_information' if stage == 'staff' else stage])
+        elif stage == 'xls':
+            completed = len(main.projects)
+        else:
+            completed = sum(1 for _, record in main.projects.items() if 'regionname' in record)
+
+        retries = sum(value for (name, _), value in main.metrics.counters.items() if name == 'retries')
+        main.projects.close()
+        main.extraction_details.close()
+
+    return {
+        'projects': len(project_ids),
+        'completed': completed,
+        'seconds': round(elapsed, 3),
+        'projects_per_minute': round(len(project_ids) / elapsed * 60, 1),
+        'p50_ms': round(percentile(latencies, 0.5) * 1000, 2) if latencies else None,
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2) if latencies else None,
+        'peak_rss_mb': peak_rss_mb(),
+        'retries': retries
+    }
+
+
+def prepare_stage(stage, directory, project_ids, seed_directory):
+    """Creates a stage's working directory: a target package, a populated projects.db, and stage inputs."""
+    os.makedirs(directory)
+    with open(os.path.join(directory, 'targets.csv'), 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['id'])
+        writer.writerows([project_id] for project_id in project_ids)
+    if stage == 'xls':
+        shutil.copy(os.path.join(seed_directory, 'dump.xls'), directory)
+    else:
+        shutil.copy(os.path.join(seed_directory, 'projects.db'), directory)
+    if stage == 'staff':
+        shutil.copytree(os.path.join(seed_directory, 'documents'), os.path.join(directory, 'documents'))
+
+
+def seed(directory, project_ids, args):
+    """Generates the inputs shared by every stage: an xls dump, projects.db loaded from it, and documents."""
+    from benchmarks.synthetic import generate_dump, generate_documents
+    from document_store import DocumentStore
+    from store import ProjectStore
+    from transform import iter_records
+
+    generate_dump(os.path.join(directory, 'dump.xls'), len(project_ids), args.columns)
+    with ProjectStore(os.path.join(directory, 'projects.db'), batch_size=1000) as projects:
+        projects.put_many(iter_records(os.path.join(directory, 'dump.xls')))
+    generate_documents(os.path.join(directory, 'documents'), len(project_ids), args.documents, args.lines)
+    # migrating into the document store is a one-off, so it isn't part of any stage's timing
+    DocumentStore(os.path.join(directory, 'documents')).close()
+
+
+def load_results(path):
+    if path == 'last':
+        previous = sorted(name for name in os.listdir(RESULTS_DIRECTORY) if name.endswith('.json')) \
+            if os.path.exists(RESULTS_DIRECTORY) else []
+        if not previous:
+            return None
+        path = os.path.join(RESULTS_DIRECTORY, previous[-1])
+    with open(path) as f:
+        results = json.loads(f.read())
+    results['path'] = path
+    return results
+
+
+def print_results(results, baseline=None):
+    print(f'{"stage":<10} {"completed":>11} {"seconds":>9} {"projects/min":>13} {"p50 ms":>9} {"p99 ms":>9} {"peak rss MB":>12} {"retries":>8}'
+        + ('  vs baseline' if baseline else ''))
+    for stage, result in results['stages'].items():
+        line = (f'{stage:<10} {str(result["completed"]) + "/" + str(result["projects"]):>11} {result["seconds"]:>9} {result["projects_per_minute"]:>13} '
+            f'{result["p50_ms"] if result["p50_ms"] is not None else "-":>9} '
+            f'{result["p99_ms"] if result["p99_ms"] is not None else "-":>9} {result["peak_rss_mb"]:>12} {result.get("retries", "-"):>8}')
+        previous = baseline['stages'].get(stage) if baseline else None
+        if previous:
+            change = (result['projects_per_minute'] / previous['projects_per_minute'] - 1) * 100
+            line += f'  {change:+.1f}% throughput'
+        print(line)
+    if baseline:
+        print(f'Compared with {baseline["path"]}')
+
+
+def main():
+    parser = ArgumentParser(description='Benchmark extraction stages against replayed fixtures')
+    parser.add_argument('--projects', type=int, default=100, help='the number of synthetic projects. Default is 100')
+    parser.add_argument('--documents', type=int, default=2, help='text documents per project. Default is 2')
+    parser.add_argument('--lines', type=int, default=2000, help='lines per text document. Default is 2000')
+    parser.add_argument('--columns', type=int, default=50, help='columns in the xls dump. Default is 50')
+    parser.add_argument('--api-page-size', type=int, default=50, help='projects per api page. Default is 50')
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=STAGES)
+    parser.add_argument('--fixtures', help='a recorded fixture directory to replay instead of synthetic pages')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds the replay server adds to each response')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='the fraction of requests the replay server \
+        answers with a 429 or 503')
+    parser.add_argument('--label', help='a name saved with the results')
+    parser.add_argument('--compare', default='last', help='a results file to compare with. Defaults to the latest saved run')
+    parser.add_argument('--no-save', action='store_true', help="don't save the results")
+    parser.add_argument('--worker', choices=STAGES, help=SUPPRESS)
+    parser.add_argument('--options', help=SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        options = json.loads(args.options)
+        print(json.dumps(run_stage(args.worker, options)))
+        return
+
+    baseline = load_results(args.compare) if args.compare else None
+    with tempfile.TemporaryDirectory() as directory:
+        fixtures = args.fixtures
+        if fixtures:
+            with open(os.path.join(fixtures, 'fixtures.json')) as f:
+                recorded = json.loads(f.read())
+            project_ids, api_page_size = recorded['project_ids'], recorded['api_page_size']
+        else:
+            from benchmarks.synthetic import generate_site
+            fixtures = os.path.join(directory, 'fixtures')
+            api_page_size = args.api_page_size
+            print(f'Generating fixtures for {args.projects} project(s)')
+            project_ids = generate_site(fixtures, args.projects, args.documents, args.lines, api_page_size)
+
+        # the dump and documents directory are always synthetic, so the stages reading them use synthetic ids
+        from benchmarks.synthetic import project_ids as synthetic_ids
+        synthetic_project_ids = synthetic_ids(len(project_ids))
+        seed_directory = os.path.join(directory, 'seed')
+        os.makedirs(seed_directory)
+        seed(seed_directory, synthetic_project_ids, args)
+
+        results = {
+            'label': args.label,
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'config': { key: getattr(args, key) for key in ('projects', 'documents', 'lines', 'columns', 'latency', 'error_rate') },
+            'stages': {}
+        }
+        results['config'].update({ 'fixtures': args.fixtures, 'projects': len(project_ids), 'api_page_size': api_page_size })
+        with ReplayServer(fixtures, latency=args.latency, error_rate=args.error_rate) as server:
+            for stage in args.stages:
+                stage_directory = os.path.join(directory, stage)
+                stage_ids = synthetic_project_ids if stage in ('staff', 'xls') else project_ids
+                prepare_stage(stage, stage_directory, stage_ids, seed_directory)
+                options = {
+                    'project_ids': stage_ids,
+                    'base_url': server.url,
+                    'api_url': f'{server.url}/{HOSTS_PREFIX}/search.worldbank.org/api/v2/projects',
+                    'api_page_size': api_page_size
+                }
+                print(f'Running {stage}')
+                output = subprocess.run([sys.executable, '-m', 'benchmarks.bench', '--worker', stage,
+                    '--options', json.dumps(options)], cwd=stage_directory, capture_output=True, text=True,
+                    env={ **os.environ, 'PYTHONPATH': REPOSITORY })
+                if output.returncode != 0:
+                    print(f'Stage {stage} failed:\n{output.stderr}')
+                    continue
+                results['stages'][stage] = json.loads(output.stdout.strip().splitlines()[-1])
+
+    print_results(results, baseline)
+    if not args.no_save:
+        os.makedirs(RESULTS_DIRECTORY, exist_ok=True)
+        name = datetime.now().strftime('%Y%m%d-%H%M%S') + (f'-{args.label}' if args.label else '')
+        with open(os.path.join(RESULTS_DIRECTORY, name + '.json'), 'w') as f:
+            f.write(json.dumps(results, indent=2))
+        print(f'Saved results to benchmarks/results/{name}.json')
+
+
+if __name__ == '__main__':
+    main()
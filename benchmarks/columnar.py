@@ -0,0 +1,124 @@
+"""Compares querying aggregated.json with querying the parquet export.
+
+Generates synthetic project records with financing rows, documents and staff,
+exports them both ways, then times a full load, a two column scan and a
+filter on region, status and approval date against each.
+
+    python -m benchmarks.columnar --projects 12000
+"""
+import os
+import sys
+import json
+import time
+import random
+import tempfile
+from datetime import date
+from argparse import ArgumentParser
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from columnar import COMPRESSIONS, export_parquet, load_keymap
+from benchmarks.synthetic import DOCUMENT_TYPES, api_project, project_ids
+from store import ProjectStore
+
+REGION = 'Africa'
+STATUS = 'Closed'
+APPROVED_SINCE = date(2015, 1, 1)
+
+
+def project_record(project_id, index, documents):
+    record = api_project(project_id, index)
+    record.update({ key: f'{key} {index}' for key in load_keymap() if key not in record })
+    record['curr_project_cost'] = float(index * 1000)
+    record['addtional_details'] = {
+        'FinancingPlan': [{ 'Financier': 'International Development Association', 'Commitments': '100.00' }],
+        'DetailedFinancialActivity': [
+            { 'Period': f'FY{period}', 'Financier': 'IDA', 'Transaction Type': 'Disbursement', 'Amount (US$)': '1,000,000' }
+            for period in range(random.randint(0, 12))
+        ]
+    }
+    record['project_documents'] = [{
+        'document_name': f'{project_id} Document {document}',
+        'date': f'June {document + 1}, 2020',
+        'report_number': f'R{project_id}{document}',
+        'document_type': DOCUMENT_TYPES[document % len(DOCUMENT_TYPES)],
+        'document_url': f'https://documents.worldbank.org/{project_id}/{document}.txt'
+    } for document in range(documents)]
+    record['staff_information'] = { 'Task Team Leader': f' Staff Member {index}' }
+    return record
+
+
+def timed(name, query):
+    start = time.perf_counter()
+    rows = query()
+    elapsed = time.perf_counter() - start
+    print(f'{name:<32} {elapsed * 1000:>10.1f} ms {rows:>8} rows')
+
+
+def json_queries(filepath):
+    def load():
+        with open(filepath) as f:
+            return len(json.loads(f.read()))
+
+    def scan():
+        with open(filepath) as f:
+            return len([(record.get('id'), record.get('project_name')) for record in json.loads(f.read()).values()])
+
+    def filtered():
+        with open(filepath) as f:
+            projects = json.loads(f.read())
+        return sum(1 for record in projects.values() if record.get('regionname') == REGION
+            and record.get('projectstatusdisplay') == STATUS
+            and record.get('boardapprovaldate', '') >= APPROVED_SINCE.isoformat())
+
+    return [('json: load', load), ('json: scan 2 columns', scan), ('json: filter', filtered)]
+
+
+def parquet_queries(directory):
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+    filepath = os.path.join(directory, 'projects.parquet')
+
+    def load():
+        return pq.read_table(filepath, memory_map=True).num_rows
+
+    def scan():
+        return pq.read_table(filepath, columns=['Project ID', 'Project Name'], memory_map=True).num_rows
+
+    def filtered():
+        condition = ((ds.field('Region') == REGION) & (ds.field('Project Status') == STATUS)
+            & (ds.field('Board Approval Date') >= APPROVED_SINCE))
+        return ds.dataset(filepath).to_table(columns=['Project ID'], filter=condition).num_rows
+
+    return [('parquet: load', load), ('parquet: scan 2 columns', scan), ('parquet: filter', filtered)]
+
+
+def main():
+    parser = ArgumentParser(description='Benchmark the parquet export against aggregated.json')
+    parser.add_argument('--projects', type=int, default=12000)
+    parser.add_argument('--documents', type=int, default=5, help='documents per project. Default is 5')
+    parser.add_argument('--compression', choices=COMPRESSIONS, default='zstd')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        with ProjectStore(os.path.join(directory, 'projects.db'), batch_size=1000) as projects:
+            projects.put_many((project_id, project_record(project_id, index, args.documents))
+                for index, project_id in enumerate(project_ids(args.projects)))
+
+            json_path = os.path.join(directory, 'aggregated.json')
+            parquet_directory = os.path.join(directory, 'aggregated_parquet')
+            start = time.perf_counter()
+            projects.export_json(json_path)
+            print(f'json export: {time.perf_counter() - start:.2f}s, {os.path.getsize(json_path) / 1024 / 1024:.1f} MB')
+            start = time.perf_counter()
+            rows = export_parquet(projects.items(), parquet_directory, compression=args.compression)
+            size = sum(entry.stat().st_size for entry in os.scandir(parquet_directory))
+            print(f'parquet export ({args.compression}): {time.perf_counter() - start:.2f}s, {size / 1024 / 1024:.1f} MB, '
+                  + ', '.join(f'{count} {table}' for table, count in rows.items()))
+
+        for name, query in json_queries(json_path) + parquet_queries(parquet_directory):
+            timed(name, query)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""Measures pdf to text conversion in pages/sec, in one process, in a process pool and from the cache.
+
+Generates a corpus of text pdfs, with staff lines on their first page, so no
+pdf tooling is needed beyond the pypdf used for conversion.
+
+    python -m benchmarks.pdf_text --files 200 --pages 20
+"""
+import os
+import sys
+import time
+import shutil
+import random
+import tempfile
+from argparse import ArgumentParser
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pdf_text import TEXT_ENCODING, TextCache, convert_pdfs
+from document_store import file_digest
+from staff import STAFF_SEARCH_TERMS
+from benchmarks.staff_extraction import FILLER
+
+
+def _escape(line):
+    return line.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+def write_pdf(path, pages):
+    """Writes a minimal pdf with one page per list of lines in pages, set in Helvetica."""
+    objects = [b'<< /Type /Catalog /Pages 2 0 R >>', None, b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>']
+    kids = []
+    for lines in pages:
+        text = ' T* '.join(f'({_escape(line)}) Tj' for line in lines)
+        stream = f'BT /F1 10 Tf 12 TL 50 780 Td {text} ET'.encode('latin1')
+        objects.append(b'<< /Length %d >>\nstream\n%s\nendstream' % (len(stream), stream))
+        objects.append(b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Resources << /Font << /F1 3 0 R >> >> '
+            b'/Contents %d 0 R >>' % len(objects))
+        kids.append(len(objects))
+    objects[1] = b'<< /Type /Pages /Kids [%s] /Count %d >>' % (b' '.join(b'%d 0 R' % kid for kid in kids), len(kids))
+
+    with open(path, 'wb') as f:
+        f.write(b'%PDF-1.4\n')
+        offsets = []
+        for number, body in enumerate(objects, 1):
+            offsets.append(f.tell())
+            f.write(b'%d 0 obj\n%s\nendobj\n' % (number, body))
+        xref = f.tell()
+        f.write(b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1))
+        f.write(b''.join(b'%010d 00000 n \n' % offset for offset in offsets))
+        f.write(b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objects) + 1, xref))
+
+
+def generate_corpus(directory, files, pages, lines=60):
+    random.seed(0)
+    for document in range(files):
+        content = [[random.choice(FILLER) for _ in range(lines)] for _ in range(pages)]
+        content[0][:len(STAFF_SEARCH_TERMS)] = [f'{term} Staff Member {document}' for term in STAFF_SEARCH_TERMS]
+        write_pdf(os.path.join(directory, f'P{document:06d}_{document}.pdf'), content)
+
+
+def run(name, tasks, cache, workers, total_pages):
+    start = time.perf_counter()
+    converted = sum(pages for _, _, pages in convert_pdfs(tasks, cache, workers=workers))
+    elapsed = time.perf_counter() - start
+    print(f'{name:<24} {elapsed:>8.2f}s {converted:>8} converted {total_pages / elapsed:>10.1f} pages/s')
+
+
+def main():
+    parser = ArgumentParser(description='Benchmark pdf to text conversion')
+    parser.add_argument('--files', type=int, default=200)
+    parser.add_argument('--pages', type=int, default=20)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        generate_corpus(directory, args.files, args.pages)
+        pdfs = sorted(entry.path for entry in os.scandir(directory) if entry.name.endswith('.pdf'))
+        tasks = [(path, file_digest(path)) for path in pdfs]
+        total_pages = args.files * args.pages
+        print(f'Corpus: {args.files} pdfs, {total_pages} pages, '
+              f'{sum(os.path.getsize(path) for path in pdfs) / 1024 / 1024:.1f} MB')
+
+        cache_directory = os.path.join(directory, '.text')
+        run('1 process', tasks, TextCache(cache_directory), 1, total_pages)
+        shutil.rmtree(cache_directory)
+        run(f'{args.workers} process pool', tasks, TextCache(cache_directory), args.workers, total_pages)
+        run('cached re-run', tasks, TextCache(cache_directory), args.workers, total_pages)
+
+        sample = TextCache(cache_directory).path(tasks[0][1])
+        with open(sample, encoding=TEXT_ENCODING) as f:
+            if STAFF_SEARCH_TERMS[0] not in f.read():
+                print('Warning: staff lines missing from converted text')
+
+
+if __name__ == '__main__':
+    main()
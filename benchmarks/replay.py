@@ -0,0 +1,231 @@
+"""Records World Bank pages and api responses to disk and serves them back from a local http server.
+
+Fixtures are stored one file per url, under the url's path, with the query
+string (for api pages) hashed into the filename. Links to other worldbank.org
+hosts, e.g. the documents site, are rewritten to /_hosts/<host>/... so a single
+replay server can serve every page and file a project touches.
+
+To record a handful of live projects for replay:
+
+    python -m benchmarks.replay record fixtures/ P175987 P176630
+
+and to serve them:
+
+    python -m benchmarks.replay serve fixtures/ --port 8766
+
+--latency and --error-rate make the server slow and flaky, to see how the
+request governor copes with a struggling site.
+"""
+import os
+import re
+import sys
+import json
+import time
+import random
+import hashlib
+import mimetypes
+import threading
+from argparse import ArgumentParser
+from urllib.parse import urlsplit
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+HOSTS_PREFIX = '_hosts'
+PROJECTS_HOST = 'projects.worldbank.org'
+OTHER_HOSTS = re.compile(r'https?://((?!%s)[\w.-]*worldbank\.org)/' % re.escape(PROJECTS_HOST))
+
+
+def fixture_path(directory, url):
+    """Where the response for url is stored. Query parameters are sorted, so their order doesn't matter."""
+    parts = urlsplit(url)
+    path = parts.path.strip('/') or 'index'
+    if parts.netloc and parts.netloc != PROJECTS_HOST and OTHER_HOSTS.match(f'{parts.scheme}://{parts.netloc}/'):
+        path = f'{HOSTS_PREFIX}/{parts.netloc}/{path}'
+    if parts.query:
+        path += '@' + hashlib.sha1('&'.join(sorted(parts.query.split('&'))).encode()).hexdigest()[:16]
+    return os.path.join(directory, *path.split('/'))
+
+
+def save_fixture(directory, url, body):
+    path = fixture_path(directory, url)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(body)
+    return path
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        if server.latency:
+            time.sleep(server.latency)
+        if server.error_rate and server.random.random() < server.error_rate:
+            self.send_error_response()
+            return
+        path = fixture_path(server.directory, self.path)
+        if not os.path.isfile(path):
+            self.send_error(404)
+            return
+        with open(path, 'rb') as f:
+            body = f.read()
+        content_type = 'application/json' if '@' in os.path.basename(path) else \
+            mimetypes.guess_type(path)[0] or 'text/html; charset=utf-8'
+        etag = '"%s"' % hashlib.sha1(body).hexdigest()
+        with server.lock:
+            server.requests += 1
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            with server.lock:
+                server.not_modified += 1
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_error_response(self):
+        # half of the injected errors are throttling responses, which ask the client to back off for a second
+        throttled = self.server.random.random() < 0.5
+        self.send_response(429 if throttled else 503)
+        if throttled:
+            self.send_header('Retry-After', '1')
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+        with self.server.lock:
+            self.server.errors += 1
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ReplayServer:
+    """Serves a fixture directory over http from a background thread.
+
+    Each response can be delayed by `latency` seconds, and a fraction
+    error_rate of requests answered with a 429 or 503 instead. Responses
+    carry an ETag, and requests sending it back get a 304.
+    """
+
+    def __init__(self, directory, port=0, latency=0.0, error_rate=0.0):
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', port), _Handler)
+        self.httpd.daemon_threads = True
+        self.httpd.directory = directory
+        self.httpd.latency = latency
+        self.httpd.error_rate = error_rate
+        self.httpd.random = random.Random(0)
+        self.httpd.lock = threading.Lock()
+        self.httpd.requests = 0
+        self.httpd.errors = 0
+        self.httpd.not_modified = 0
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name='replay', daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    @property
+    def requests(self):
+        return self.httpd.requests
+
+    @property
+    def errors(self):
+        return self.httpd.errors
+
+    @property
+    def not_modified(self):
+        return self.httpd.not_modified
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def record(directory, project_ids, document_types=None, api_page_size=500, browser=False):
+    """Saves each project's detail pages, document pages and files, and the api pages covering them."""
+    import requests
+    from api import API_URL, ProjectsApi
+    from pages import BASE_URL, document_detail_url, project_detail_url, parse_page, document_page_links, document_file_links
+    from benchmarks.synthetic import DOCUMENT_TYPES
+
+    session = requests.Session()
+    driver = None
+    if browser:
+        from selenium import webdriver
+        from selenium.webdriver.chrome.options import Options
+        options = Options()
+        options.add_argument('--headless')
+        driver = webdriver.Chrome(options=options)
+
+    def page(url):
+        if driver:
+            driver.get(url)
+            html = driver.page_source
+        else:
+            response = session.get(url, timeout=60)
+            response.raise_for_status()
+            html = response.text
+        # links to other worldbank hosts are served by the replay server under /_hosts
+        save_fixture(directory, url, OTHER_HOSTS.sub(lambda match: f'/{HOSTS_PREFIX}/{match.group(1)}/', html).encode())
+        return parse_page(html, url)
+
+    try:
+        for project_id in project_ids:
+            print(f'Recording project {project_id}')
+            rows = page(document_detail_url(project_id, BASE_URL)).rows
+            for document_page in document_page_links(rows, document_types or DOCUMENT_TYPES):
+                for file_link in document_file_links(page(document_page).links):
+                    response = session.get(file_link, timeout=120)
+                    response.raise_for_status()
+                    save_fixture(directory, file_link, response.content)
+            page(project_detail_url(project_id, BASE_URL))
+
+        api = ProjectsApi(API_URL, page_size=api_page_size)
+        for offset in range(0, len(project_ids), api_page_size):
+            url = api.page_url(offset, min(api_page_size, len(project_ids) - offset))
+            save_fixture(directory, url, json.dumps(api.fetch(url)).encode())
+    finally:
+        if driver:
+            driver.quit()
+
+    with open(os.path.join(directory, 'fixtures.json'), 'w') as f:
+        f.write(json.dumps({ 'project_ids': list(project_ids), 'api_page_size': api_page_size }))
+
+
+def main():
+    parser = ArgumentParser(description='Record or replay World Bank fixtures')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    record_parser = subparsers.add_parser('record', help='record live pages for the given projects')
+    record_parser.add_argument('directory')
+    record_parser.add_argument('project_ids', nargs='+')
+    record_parser.add_argument('--api-page-size', type=int, default=500)
+    record_parser.add_argument('--browser', action='store_true', help='render pages in chrome before saving them')
+    serve_parser = subparsers.add_parser('serve', help='serve a fixture directory')
+    serve_parser.add_argument('directory')
+    serve_parser.add_argument('--port', type=int, default=8766)
+    serve_parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every response')
+    serve_parser.add_argument('--error-rate', type=float, default=0.0, help='the fraction of requests answered \
+        with a 429 or 503')
+    args = parser.parse_args()
+
+    if args.command == 'record':
+        return record(args.directory, args.project_ids, api_page_size=args.api_page_size, browser=args.browser)
+    with ReplayServer(args.directory, args.port, args.latency, args.error_rate) as server:
+        print(f'Serving {args.directory} at {server.url}')
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == '__main__':
+    main()
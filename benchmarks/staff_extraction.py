@@ -0,0 +1,116 @@
+"""Compares the legacy per-project staff extraction with the indexed extractor.
+
+Generates a synthetic documents directory of text files, a few staff lines
+buried in filler, and reports elapsed time and throughput in MB/s.
+
+    python -m benchmarks.staff_extraction --projects 2000 --files 3 --lines 2000
+"""
+import os
+import sys
+import time
+import random
+import tempfile
+from argparse import ArgumentParser
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from staff import DOCUMENT_ENCODING, STAFF_SEARCH_TERMS, extract_projects
+
+FILLER = [
+    'The project development objective is to improve access to basic services in rural areas.',
+    'Component 1 will finance civil works, goods, and consultant services for the implementing agency.',
+    'Disbursements are expected to follow the schedule set out in Annex 3 of this document.',
+    'Environmental and social risks are rated Substantial given the scale of the civil works.'
+]
+
+
+def generate_corpus(directory, projects, files, lines):
+    random.seed(0)
+    for project in range(projects):
+        for document in range(files):
+            with open(os.path.join(directory, f'P{project:06d}_{document}.txt'), 'w', encoding='latin1') as f:
+                for line in range(lines):
+                    if line % 500 == 0:
+                        # one value per key and project, so file order doesn't change the result
+                        term = random.choice(STAFF_SEARCH_TERMS)
+                        f.write(f'{term} Staff Member {project}-{STAFF_SEARCH_TERMS.index(term)}\n')
+                    else:
+                        f.write(random.choice(FILLER) + '\n')
+
+
+def index_documents(directory='./documents', extension='.txt'):
+    """Groups document filenames by project id in a single pass over the directory."""
+    index = {}
+    if not os.path.exists(directory):
+        return index
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.name.endswith(extension) and '_' in entry.name:
+                index.setdefault(entry.name[:entry.name.find('_')], []).append(entry.name)
+    for filenames in index.values():
+        filenames.sort()
+    return index
+
+
+
+# extract_staff_information as it was in main.py, minus the prints and persistence
+def legacy_extract(directory, project_id):
+    staff_information = {}
+    project_text_documents = [x for x in os.listdir(directory) if x.startswith(project_id) and x.endswith('.txt')]
+    for filename in project_text_documents:
+        with open(os.path.join(directory, filename), 'r', encoding='latin1') as f:
+            for line in f.readlines():
+                for search_term in STAFF_SEARCH_TERMS:
+                    if search_term in line:
+                        line_data = ' '.join(line.split()).split(':')
+                        if len(line_data) == 2:
+                            key, value = line_data
+                            staff_information[key] = value
+    return staff_information
+
+
+def indexed_extract(directory, workers):
+    document_index = index_documents(directory)
+    tasks = [(project_id, [(os.path.join(directory, filename), DOCUMENT_ENCODING) for filename in filenames])
+        for project_id, filenames in document_index.items()]
+    return dict(extract_projects(tasks, workers=workers))
+
+
+def report(name, elapsed, total_bytes):
+    print(f'{name:<22} {elapsed:>8.2f}s {total_bytes / elapsed / 1024 / 1024:>10.1f} MB/s')
+
+
+def main():
+    parser = ArgumentParser(description='Benchmark staff information extraction')
+    parser.add_argument('--projects', type=int, default=2000)
+    parser.add_argument('--files', type=int, default=3)
+    parser.add_argument('--lines', type=int, default=2000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--skip-legacy', action='store_true', help='the legacy extractor is quadratic in corpus size')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        generate_corpus(directory, args.projects, args.files, args.lines)
+        total_bytes = sum(entry.stat().st_size for entry in os.scandir(directory))
+        print(f'Corpus: {args.projects * args.files} files, {total_bytes / 1024 / 1024:.1f} MB')
+
+        results = {}
+        if not args.skip_legacy:
+            start = time.perf_counter()
+            results['legacy'] = { f'P{project:06d}': legacy_extract(directory, f'P{project:06d}') for project in range(args.projects) }
+            report('legacy', time.perf_counter() - start, total_bytes)
+
+        start = time.perf_counter()
+        results['indexed'] = indexed_extract(directory, 1)
+        report('indexed (1 process)', time.perf_counter() - start, total_bytes)
+
+        start = time.perf_counter()
+        results['pool'] = indexed_extract(directory, args.workers)
+        report(f'indexed ({args.workers} process pool)', time.perf_counter() - start, total_bytes)
+
+        if 'legacy' in results and results['legacy'] != results['indexed']:
+            print('Warning: legacy and indexed results differ')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+"""Tracks main.py's startup time and peak RSS for the commands that don't scrape.
+
+Seeds a working directory with a synthetic projects.db, documents and
+extraction details for the given number of projects, then runs each command
+in a fresh process, reporting the median wall time and the peak RSS. Results
+are saved to benchmarks/results/startup and compared with the previous run:
+
+    python -m benchmarks.startup --projects 12000
+"""
+import os
+import sys
+import json
+import time
+import statistics
+import subprocess
+import tempfile
+from datetime import datetime
+from argparse import ArgumentParser
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench import REPOSITORY, RESULTS_DIRECTORY, seed
+from benchmarks.synthetic import project_ids
+
+STARTUP_RESULTS_DIRECTORY = os.path.join(RESULTS_DIRECTORY, 'startup')
+
+# run in this order, so e.g. --stats sees the extraction details --retro recorded
+COMMANDS = {
+    'python': None,
+    'help': ['-h'],
+    'retro': ['--retro', '-d'],
+    'stats': ['--stats'],
+    'reset': ['-r', '-m'],
+    'export': ['--export'],
+    'xls_to_json': ['--xls-to-json', '-f', 'dump.xls', '-o', 'projects.jsonl'],
+    'staff': ['-s', '-n', '1', '--staff-workers', '1']
+}
+
+
+# runs main.py (or nothing) and reports the process's peak RSS on exit. VmHWM is used rather than
+# ru_maxrss, which on Linux carries over the parent's memory through fork and exec
+RUN_AND_REPORT = """
+import atexit, runpy, sys
+def report():
+    with open('/proc/self/status') as f:
+        sys.stderr.write(next(line for line in f if line.startswith('VmHWM')))
+atexit.register(report)
+sys.argv = sys.argv[1:]
+if sys.argv:
+    sys.path.insert(0, %r)
+    runpy.run_path(sys.argv[0], run_name='__main__')
+""" % REPOSITORY
+
+
+def run_command(arguments, directory):
+    """Returns (seconds, peak rss in MB) for one run of main.py with arguments, or of a bare interpreter."""
+    main_arguments = [] if arguments is None else [os.path.join(REPOSITORY, 'main.py'), *arguments]
+    start = time.perf_counter()
+    output = subprocess.run([sys.executable, '-c', RUN_AND_REPORT, *main_arguments], cwd=directory,
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    elapsed = time.perf_counter() - start
+    if output.returncode != 0:
+        raise RuntimeError(f'main.py {" ".join(arguments)} failed:\n{output.stderr}')
+    peak = [line for line in output.stderr.splitlines() if line.startswith('VmHWM')][-1]
+    return elapsed, int(peak.split()[1]) / 1024
+
+
+def load_previous():
+    previous = sorted(name for name in os.listdir(STARTUP_RESULTS_DIRECTORY) if name.endswith('.json')) \
+        if os.path.exists(STARTUP_RESULTS_DIRECTORY) else []
+    if not previous:
+        return None
+    with open(os.path.join(STARTUP_RESULTS_DIRECTORY, previous[-1])) as f:
+        return json.loads(f.read())
+
+
+def main():
+    parser = ArgumentParser(description='Benchmark main.py startup for non-scraping commands')
+    parser.add_argument('--projects', type=int, default=12000)
+    parser.add_argument('--documents', type=int, default=1, help='text documents per project. Default is 1')
+    parser.add_argument('--lines', type=int, default=200, help='lines per text document. Default is 200')
+    parser.add_argument('--columns', type=int, default=50, help='columns in the xls dump. Default is 50')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per command. Default is 3')
+    parser.add_argument('--no-save', action='store_true', help="don't save the results")
+    args = parser.parse_args()
+
+    previous = load_previous()
+    results = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'config': { 'projects': args.projects, 'repeat': args.repeat },
+        'commands': {}
+    }
+    with tempfile.TemporaryDirectory() as directory:
+        print(f'Seeding {args.projects} projects')
+        seed(directory, project_ids(args.projects), args)
+
+        print(f'{"command":<12} {"seconds":>9} {"peak rss MB":>12}' + ('  vs previous' if previous else ''))
+        for name, arguments in COMMANDS.items():
+            runs = [run_command(arguments, directory) for _ in range(args.repeat)]
+            result = {
+                'seconds': round(statistics.median(seconds for seconds, _ in runs), 3),
+                'peak_rss_mb': round(max(rss for _, rss in runs), 1)
+            }
+            results['commands'][name] = result
+            line = f'{name:<12} {result["seconds"]:>9} {result["peak_rss_mb"]:>12}'
+            before = previous['commands'].get(name) if previous else None
+            if before:
+                line += f'  {result["seconds"] - before["seconds"]:+.3f}s {result["peak_rss_mb"] - before["peak_rss_mb"]:+.1f} MB'
+            print(line)
+
+    if not args.no_save:
+        os.makedirs(STARTUP_RESULTS_DIRECTORY, exist_ok=True)
+        name = datetime.now().strftime('%Y%m%d-%H%M%S') + '.json'
+        with open(os.path.join(STARTUP_RESULTS_DIRECTORY, name), 'w') as f:
+            f.write(json.dumps(results, indent=2))
+        print(f'Saved results to benchmarks/results/startup/{name}')
+
+
+if __name__ == '__main__':
+    main()
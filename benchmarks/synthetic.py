@@ -0,0 +1,117 @@
+"""Generates synthetic World Bank fixtures at a configurable scale.
+
+A site of document-detail, project-detail and document pages with their text
+files, the api pages covering the same projects, a documents/ directory as left
+by document extraction, and an xls dump. Project ids are P000000, P000001, ...
+throughout, so every generated piece describes the same projects.
+"""
+import os
+import sys
+import json
+import random
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api import API_URL, ProjectsApi
+from pages import BASE_URL, document_detail_url, project_detail_url
+from benchmarks.replay import save_fixture
+from benchmarks.staff_extraction import FILLER, generate_corpus
+from benchmarks.xls_transform import generate_workbook
+from staff import STAFF_SEARCH_TERMS
+
+# as in main.py's document_search_terms
+DOCUMENT_TYPES = [
+    'Project Appraisal Document',
+    'Project Information Document',
+    'Project Paper',
+    'Project Information and Integrated Safeguards Data Sheet',
+    'Staff Appraisal Report',
+    'Memorandum & Recommendation of the President'
+]
+
+
+def project_ids(count):
+    return [f'P{project:06d}' for project in range(count)]
+
+
+def document_text(project, lines):
+    text = []
+    for line in range(lines):
+        if line % 500 == 0:
+            term = STAFF_SEARCH_TERMS[(line // 500) % len(STAFF_SEARCH_TERMS)]
+            text.append(f'{term} Staff Member {project}-{STAFF_SEARCH_TERMS.index(term)}')
+        else:
+            text.append(random.choice(FILLER))
+    return '\n'.join(text) + '\n'
+
+
+def document_detail_page(project_id, documents):
+    rows = ['<tr><th>Document Name</th><th>Date</th><th>Report Number</th><th>Document Type</th></tr>']
+    for document in range(documents):
+        rows.append(f'<tr><td><a href="/doc/{project_id}/{document}">{project_id} Document {document}</a></td>'
+            f'<td>June {document + 1}, 2020</td><td>R{project_id}{document}</td>'
+            f'<td>{DOCUMENT_TYPES[document % len(DOCUMENT_TYPES)]}</td></tr>')
+    # a document of a type that isn't fetched by default
+    rows.append(f'<tr><td><a href="/doc/{project_id}/other">Procurement Plan</a></td><td>July 1, 2020</td>'
+        f'<td>RP{project_id}</td><td>Procurement Plan</td></tr>')
+    return f'<html><body><table>{"".join(rows)}</table></body></html>'
+
+
+def project_detail_page(project_id):
+    cells = lambda values: ''.join(f'<td data-th="{key}:">{value}</td>' for key, value in values.items())
+    rows = [
+        { 'Financier': 'International Development Association', 'Commitments': '100.00' },
+        { 'IBRD/IDA': 'IDA', 'Product Line': 'IBRD/IDA' },
+        { 'Investment Project Financing': 'Yes', 'Lending Instrument': 'Investment Project Financing' },
+        { 'Period': 'FY21', 'Financier': 'IDA', 'Transaction Type': 'Disbursement', 'Amount (US$)': '1,000,000' }
+    ]
+    return '<html><body><table>' + ''.join(f'<tr>{cells(row)}</tr>' for row in rows) + f'</table><p>{project_id}</p></body></html>'
+
+
+def api_project(project_id, index):
+    return {
+        'id': project_id,
+        'project_name': f'Synthetic Project {index}',
+        'projectstatusdisplay': 'Active' if index % 3 else 'Closed',
+        'regionname': ['Africa', 'East Asia and Pacific', 'South Asia'][index % 3],
+        'boardapprovaldate': f'{2000 + index % 22}-06-30T00:00:00Z',
+        'lastupdatedate': f'{2021 + index % 2}-01-01T00:00:00Z'
+    }
+
+
+def generate_site(directory, count, documents=2, lines=2000, api_page_size=500):
+    """Writes replay fixtures for count projects, each with `documents` text documents of `lines` lines."""
+    random.seed(0)
+    ids = project_ids(count)
+    for index, project_id in enumerate(ids):
+        save_fixture(directory, document_detail_url(project_id, BASE_URL), document_detail_page(project_id, documents).encode())
+        save_fixture(directory, project_detail_url(project_id, BASE_URL), project_detail_page(project_id).encode())
+        for document in range(documents):
+            file_path = f'/files/{project_id}/{document}.txt'
+            save_fixture(directory, f'{BASE_URL}/doc/{project_id}/{document}',
+                f'<html><body><a href="{file_path}">Text version</a></body></html>'.encode())
+            save_fixture(directory, BASE_URL + file_path, document_text(index, lines).encode('latin1'))
+
+    api = ProjectsApi(API_URL, page_size=api_page_size)
+    for offset in range(0, count, api_page_size):
+        rows = min(api_page_size, count - offset)
+        page = {
+            'total': count,
+            'projects': { project_id: api_project(project_id, offset + index) for index, project_id in enumerate(ids[offset:offset + rows]) }
+        }
+        save_fixture(directory, api.page_url(offset, rows), json.dumps(page).encode())
+
+    with open(os.path.join(directory, 'fixtures.json'), 'w') as f:
+        f.write(json.dumps({ 'project_ids': ids, 'api_page_size': api_page_size }))
+    return ids
+
+
+def generate_documents(directory, count, files=3, lines=2000):
+    """Writes a documents directory of text files, as left by document extraction."""
+    os.makedirs(directory, exist_ok=True)
+    generate_corpus(directory, count, files, lines)
+
+
+def generate_dump(filepath, count, columns=50):
+    """Writes an xls dump of count projects."""
+    generate_workbook(filepath, count, columns)
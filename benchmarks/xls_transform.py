@@ -0,0 +1,126 @@
+"""Compares the legacy xls-to-json transform with the streaming transformer.
+
+Generates a synthetic World Bank projects workbook (title rows, a row of
+abbreviated column names, then one row per project) and runs each variant in
+a fresh process, reporting wall time and peak RSS.
+
+    python -m benchmarks.xls_transform --rows 20000 --columns 50
+"""
+import os
+import sys
+import json
+import time
+import resource
+import tempfile
+import subprocess
+from argparse import ArgumentParser
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+VARIANTS = ['legacy', 'jsonl', 'store']
+
+
+def generate_workbook(filepath, rows, columns):
+    import xlwt
+    workbook = xlwt.Workbook()
+    sheet = workbook.add_sheet('World Bank Projects')
+    sheet.write(0, 0, 'World Bank Projects')
+    sheet.write(1, 0, 'Synthetic dump')
+    keys = ['id'] + [f'column_{index}' for index in range(1, columns)]
+    for index, key in enumerate(keys):
+        sheet.write(2, index, key)
+    for row in range(rows):
+        sheet.write(row + 3, 0, f'P{row:06d}')
+        for index in range(1, columns):
+            sheet.write(row + 3, index, f'value {row}:{index}' if index % 2 else row * index * 0.5)
+    workbook.save(filepath)
+
+
+# the transform as it was in main.py, minus the per-project print
+def legacy_transform(filepath, output):
+    import xlrd
+    workbook = xlrd.open_workbook(filepath)
+    sheet = workbook.sheet_by_index(0)
+
+    abbr_keys = []
+    for cell in sheet.row(2):
+        abbr_keys.append(cell.value)
+
+    xls_data = {}
+    for i in range(3, sheet.nrows):
+        project_id = sheet.row(i)[0].value
+        xls_data[project_id] = {}
+        for index in range(len(sheet.row(i))):
+            xls_data[project_id][abbr_keys[index]] = sheet.row(i)[index].value
+
+    with open(output, 'w') as f:
+        f.write(json.dumps(xls_data))
+    return len(xls_data)
+
+
+def peak_rss_mb():
+    # VmHWM is this process' own high-water mark. ru_maxrss survives exec on linux,
+    # so it would include the parent's peak from generating the workbook
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def run_variant(variant, filepath, directory):
+    from transform import iter_records, write_jsonl
+    from store import ProjectStore
+
+    start = time.perf_counter()
+    if variant == 'legacy':
+        count = legacy_transform(filepath, os.path.join(directory, 'aggregated.json'))
+    elif variant == 'jsonl':
+        count = write_jsonl(iter_records(filepath), os.path.join(directory, 'projects.jsonl'))
+    else:
+        with ProjectStore(os.path.join(directory, 'projects.db'), batch_size=1000) as projects:
+            count = projects.put_many(iter_records(filepath))
+    elapsed = time.perf_counter() - start
+    print(json.dumps({
+        'variant': variant,
+        'projects': count,
+        'seconds': round(elapsed, 3),
+        'peak_rss_mb': peak_rss_mb()
+    }))
+
+
+def main():
+    parser = ArgumentParser(description='Benchmark the xls-to-json transform')
+    parser.add_argument('--rows', type=int, default=20000)
+    parser.add_argument('--columns', type=int, default=50)
+    parser.add_argument('--variant', choices=VARIANTS, help='run a single variant against --workbook')
+    parser.add_argument('--workbook', help='an existing workbook to transform')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        if args.variant:
+            return run_variant(args.variant, args.workbook, directory)
+
+        workbook = args.workbook
+        if not workbook:
+            workbook = os.path.join(directory, 'synthetic.xls')
+            print(f'Generating {args.rows} x {args.columns} workbook')
+            generate_workbook(workbook, args.rows, args.columns)
+
+        results = []
+        for variant in VARIANTS:
+            output = subprocess.run([sys.executable, '-m', 'benchmarks.xls_transform', '--variant', variant,
+                '--workbook', workbook], capture_output=True, text=True, check=True,
+                cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))).stdout
+            results.append(json.loads(output.strip().splitlines()[-1]))
+
+        print(f'{"variant":<8} {"projects":>9} {"seconds":>9} {"peak rss (MB)":>14}')
+        for result in results:
+            print(f'{result["variant"]:<8} {result["projects"]:>9} {result["seconds"]:>9} {result["peak_rss_mb"]:>14}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+import queue
+import logging
+import threading
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class CountingDriver:
+    """Wraps a WebDriver, counting the protocol round trips made through it.
+
+    Every public attribute access on the wrapped driver (a method call or a
+    property such as current_url) costs one round trip. The count only grows:
+    each BrowserReader reports the calls made since it was created, so a
+    change that reintroduces per-element calls shows up in the output.
+    """
+
+    def __init__(self, driver):
+        self._driver = driver
+        self.calls = 0
+
+    def __getattr__(self, name):
+        if not name.startswith('_'):
+            self.calls += 1
+        return getattr(self._driver, name)
+
+
+class BrowserPool:
+    """Runs scraping tasks across a pool of WebDriver sessions.
+
+    Each worker thread owns one browser and pulls project ids from a shared
+    queue. Workers only scrape; results are handed back to the caller's thread
+    through map(), so the coordinator remains the only writer of extraction
+    state and project data. A worker whose browser dies is given a fresh one
+    and the interrupted item is retried. Other threads (such as pipeline
+    stages) can get a browser of their own through driver() and call().
+    """
+
+    def __init__(self, size, create_driver, max_restarts=3):
+        self.size = size
+        self.create_driver = create_driver
+        self.max_restarts = max_restarts
+        self._drivers = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _start_driver(self):
+        driver = self.create_driver()
+        with self._lock:
+            self._drivers.append(driver)
+        return driver
+
+    def _stop_driver(self, driver):
+        with self._lock:
+            if driver in self._drivers:
+                self._drivers.remove(driver)
+        try:
+            driver.quit()
+        except Exception:
+            pass
+
+    @staticmethod
+    def _is_alive(driver):
+        try:
+            driver.current_url
+            return True
+        except Exception:
+            return False
+
+    def driver(self):
+        """Returns the calling thread's browser, starting it on first use."""
+        if getattr(self._local, 'driver', None) is None:
+            self._local.driver = self._start_driver()
+        return self._local.driver
+
+    def call(self, task, item):
+        """Runs task(driver, item) on the calling thread's browser, restarting the browser and retrying if it crashes."""
+        for attempt in range(self.max_restarts + 1):
+            driver = None
+            try:
+                driver = self.driver()
+                return task(driver, item)
+            except Exception as e:
+                if driver is not None and self._is_alive(driver):
+                    raise
+                # the browser crashed (or never started). restart it and retry the item
+                logger.warning('Browser worker %s crashed on %s: %s', threading.current_thread().name, item, e)
+                metrics.count('browser_restarts')
+                if driver is not None:
+                    self._stop_driver(driver)
+                    self._local.driver = None
+                if attempt == self.max_restarts:
+                    raise
+
+    def _work(self, task, items, results):
+        while True:
+            item = items.get()
+            if item is None:
+                break
+            try:
+                results.put((item, self.call(task, item), None))
+            except Exception as e:
+                results.put((item, None, e))
+        if getattr(self._local, 'driver', None) is not None:
+            self._stop_driver(self._local.driver)
+            self._local.driver = None
+
+    def map(self, task, items):
+        """Runs task(driver, item) for every item, yielding (item, result, error) as tasks complete."""
+        items = list(items)
+        work = queue.Queue()
+        results = queue.Queue()
+        for item in items:
+            work.put(item)
+        workers = min(self.size, len(items))
+        for _ in range(workers):
+            work.put(None)
+
+        threads = [
+            threading.Thread(target=self._work, args=(task, work, results), name=f'browser-{i}', daemon=True)
+            for i in range(workers)
+        ]
+        [thread.start() for thread in threads]
+        for _ in range(len(items)):
+            yield results.get()
+        [thread.join() for thread in threads]
+
+    def close(self):
+        for driver in list(self._drivers):
+            self._stop_driver(driver)
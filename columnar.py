@@ -0,0 +1,173 @@
+import os
+import json
+from datetime import date, datetime
+
+from pages import FINANCING_TABLES
+
+KEYMAP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'keymap.json')
+COMPRESSIONS = ('zstd', 'snappy', 'gzip', 'none')
+
+# nested record fields, each written to a child table instead of the projects table
+CHILD_KEYS = ('addtional_details', 'project_documents', 'staff_information')
+# projects are sorted on these, so row group statistics let readers skip most of the file when filtering on them
+SORT_KEYS = ('regionname', 'projectstatusdisplay', 'boardapprovaldate')
+DOCUMENT_COLUMNS = {
+    'document_name': 'Document Name',
+    'date': 'Date',
+    'report_number': 'Report Number',
+    'document_type': 'Document Type',
+    'document_url': 'Document URL'
+}
+FINANCING_COLUMNS = list(dict.fromkeys(column for table in FINANCING_TABLES for column in list(table.values())[0]))
+DATE_FORMATS = ('%m/%d/%Y', '%B %d, %Y', '%b %d, %Y')
+
+
+def load_keymap(filepath=KEYMAP_PATH):
+    """Returns the abbreviated xls column names mapped to their readable names."""
+    with open(filepath, 'r') as f:
+        return { key: name.strip() for key, name in json.loads(f.read()).items() }
+
+
+class Columns:
+    """Rows with differing keys, buffered column by column. Missing values are None."""
+
+    def __init__(self, names=()):
+        self.columns = { name: [] for name in names }
+        self.rows = 0
+
+    def append(self, row):
+        for key, value in row.items():
+            if key not in self.columns:
+                self.columns[key] = [None] * self.rows
+            self.columns[key].append(value)
+        self.rows += 1
+        for values in self.columns.values():
+            if len(values) < self.rows:
+                values.append(None)
+
+
+def flat_value(value):
+    if value == '' or value is None:
+        return None
+    if isinstance(value, (list, dict)):
+        return json.dumps(value)
+    return value
+
+
+def parse_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    if not isinstance(value, str):
+        return None
+    value = value.strip()
+    # iso dates, including the api's 2021-06-30T00:00:00Z timestamps
+    formats = (('%Y-%m-%d', value[:10]),) if value[4:5] == '-' else ((format, value) for format in DATE_FORMATS)
+    for format, text in formats:
+        try:
+            return datetime.strptime(text, format).date()
+        except ValueError:
+            pass
+    return None
+
+
+def parse_number(value):
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return float(value.replace(',', ''))
+    except (AttributeError, ValueError):
+        return None
+
+
+def convert(values, parse):
+    """Returns values parsed with parse, or None as soon as one doesn't parse. Missing values stay None."""
+    converted = []
+    parsed_values = {}
+    for value in values:
+        if value is None:
+            converted.append(None)
+            continue
+        # columns repeat the same few values (statuses, dates) many times over
+        key = (type(value), value)
+        if key not in parsed_values:
+            parsed_values[key] = parse(value)
+        if parsed_values[key] is None:
+            return None
+        converted.append(parsed_values[key])
+    return converted
+
+
+def typed_array(name, values):
+    """Converts a column to dates if every value is one (for columns named ...date), else numbers, else strings."""
+    import pyarrow as pa
+    if all(value is None for value in values):
+        return pa.array(values, pa.string())
+    if name.lower().endswith('date'):
+        dates = convert(values, parse_date)
+        if dates is not None:
+            return pa.array(dates, pa.date32())
+    numbers = convert(values, parse_number)
+    if numbers is not None:
+        return pa.array(numbers, pa.float64())
+    return pa.array([None if value is None else str(value).strip() for value in values], pa.string())
+
+
+def write_table(columns, filepath, names=None, sort_keys=(), compression='zstd', row_group_size=1024):
+    """Writes buffered columns to a parquet file, renaming them with names, sorted on sort_keys."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    names = names or {}
+    table = pa.table({ names.get(key, key): typed_array(key, values) for key, values in columns.columns.items() })
+    sort_keys = [(names.get(key, key), 'ascending') for key in sort_keys if key in columns.columns]
+    if sort_keys and table.num_rows:
+        table = table.sort_by(sort_keys)
+    temp_path = filepath + '.tmp'
+    pq.write_table(table, temp_path, compression=None if compression == 'none' else compression,
+        row_group_size=row_group_size, write_statistics=True)
+    os.replace(temp_path, filepath)
+    return table.num_rows
+
+
+def export_parquet(items, directory, keymap=None, compression='zstd', row_group_size=1024):
+    """Writes (project_id, record) pairs to a directory of parquet tables, returning the rows in each.
+
+    projects.parquet holds one row per project: its flat attributes, renamed
+    with keymap.json, with nested values other than the child tables below
+    kept as json strings. Child tables are keyed by Project ID:
+    financing.parquet has a row per addtional_details financing row, tagged
+    with its table; documents.parquet a row per project document; and
+    staff.parquet a row per staff role. Columns are typed as dates, numbers or
+    strings from their values. Projects are sorted by region, status and
+    approval date so that filters on them skip whole row groups.
+    """
+    keymap = keymap if keymap is not None else load_keymap()
+    projects = Columns(keymap)
+    financing = Columns(['id', 'Table'] + FINANCING_COLUMNS)
+    documents = Columns(['id'] + list(DOCUMENT_COLUMNS))
+    staff = Columns(['id', 'Role', 'Name'])
+
+    for project_id, record in items:
+        projects.append({ 'id': project_id, **{ key: flat_value(value) for key, value in record.items()
+            if key not in CHILD_KEYS and key != 'id' } })
+        for table, rows in (record.get('addtional_details') or {}).items():
+            for row in rows:
+                financing.append({ 'id': project_id, 'Table': table, **row })
+        for document in record.get('project_documents') or []:
+            documents.append({ 'id': project_id, **document })
+        for role, name in (record.get('staff_information') or {}).items():
+            staff.append({ 'id': project_id, 'Role': role, 'Name': name })
+
+    os.makedirs(directory, exist_ok=True)
+    options = { 'compression': compression, 'row_group_size': row_group_size }
+    id_name = { 'id': keymap.get('id', 'id') }
+    return {
+        'projects': write_table(projects, os.path.join(directory, 'projects.parquet'), keymap, SORT_KEYS, **options),
+        'financing': write_table(financing, os.path.join(directory, 'financing.parquet'), id_name, **options),
+        'documents': write_table(documents, os.path.join(directory, 'documents.parquet'),
+            { **id_name, **DOCUMENT_COLUMNS }, **options),
+        'staff': write_table(staff, os.path.join(directory, 'staff.parquet'), id_name, **options)
+    }
@@ -0,0 +1,214 @@
+import os
+import json
+import shutil
+import hashlib
+import logging
+import threading
+
+from journal import end_last_line, read_entries
+
+logger = logging.getLogger(__name__)
+
+BLOB_DIRECTORY = '.blobs'
+MANIFEST = 'manifest.jsonl'
+
+
+def file_digest(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def project_id_of(name):
+    return name[:name.find('_')]
+
+
+class DocumentStore:
+    """Content-addressed store for downloaded documents.
+
+    Each distinct file is kept once under documents/.blobs, named by its
+    sha256. The usual documents/{project_id}_{basename} names are hard links
+    to those blobs (falling back to symlinks, then copies), so anything that
+    reads the directory keeps working. manifest.jsonl records each name with
+    its digest and source url. It is loaded into dicts, so lookups by name,
+    project, digest or url don't touch the filesystem, and a url already
+    fetched for one project is linked into another without downloading it.
+    """
+
+    def __init__(self, directory='./documents'):
+        self.directory = directory
+        self.blob_directory = os.path.join(directory, BLOB_DIRECTORY)
+        self.manifest_path = os.path.join(directory, MANIFEST)
+        self._names = {}
+        self._projects = {}
+        self._digests = {}
+        self._urls = {}
+        self._lock = threading.Lock()
+        os.makedirs(self.blob_directory, exist_ok=True)
+
+        self._load()
+        self._manifest = open(self.manifest_path, 'a')
+        # on every open, not just the first, so an interrupted migration picks up where it stopped
+        self.migrate()
+
+    def _load(self):
+        if not os.path.exists(self.manifest_path):
+            return
+        for entry in read_entries(self.manifest_path):
+            self._index(entry)
+        # so new entries aren't appended onto a line torn by an interrupted run
+        end_last_line(self.manifest_path)
+
+    def _index(self, entry):
+        self._names[entry['name']] = entry
+        self._projects.setdefault(project_id_of(entry['name']), {})[entry['name']] = None
+        self._digests[entry['digest']] = entry['extension']
+        if entry.get('url'):
+            self._urls[entry['url']] = entry
+
+    def _record(self, name, digest, url=None):
+        entry = { 'name': name, 'digest': digest, 'extension': self._digests.get(digest, ''), 'url': url }
+        self._index(entry)
+        self._manifest.write(json.dumps(entry) + '\n')
+        self._manifest.flush()
+
+    def __contains__(self, name):
+        return name in self._names
+
+    def __len__(self):
+        return len(self._names)
+
+    def blob_path(self, digest):
+        return os.path.join(self.blob_directory, digest[:2], digest + self._digests.get(digest, ''))
+
+    def blob(self, name):
+        """Returns the path of the blob holding a document's content, or None if the name isn't stored."""
+        entry = self._names.get(name)
+        return self.blob_path(entry['digest']) if entry else None
+
+    def digest(self, name):
+        entry = self._names.get(name)
+        return entry['digest'] if entry else None
+
+    def entry(self, name):
+        """Returns a document's manifest entry (name, digest, extension and url), or None if the name isn't stored."""
+        return self._names.get(name)
+
+    def project_ids(self):
+        return list(self._projects.keys())
+
+    def names(self, project_id):
+        return sorted(self._projects.get(project_id, {}))
+
+    def paths(self, project_id, extension=None):
+        """Returns the paths of a project's documents, optionally only those ending with extension."""
+        return [
+            os.path.join(self.directory, name) for name in self.names(project_id)
+            if extension is None or name.endswith(extension)
+        ]
+
+    def _link(self, blob, name):
+        target = os.path.join(self.directory, name)
+        if os.path.lexists(target):
+            os.remove(target)
+        try:
+            os.link(blob, target)
+        except OSError:
+            try:
+                os.symlink(os.path.relpath(blob, self.directory), target)
+            except OSError:
+                shutil.copyfile(blob, target)
+
+    def _add_blob(self, source, digest, extension, move):
+        """Stores source as the blob for digest, unless one already exists. Returns whether it was new."""
+        if digest in self._digests:
+            if move:
+                os.remove(source)
+            return False
+        self._digests[digest] = extension
+        blob = self.blob_path(digest)
+        if os.path.exists(blob):
+            # written by an interrupted run before its manifest entry was
+            if move:
+                os.remove(source)
+            return False
+        os.makedirs(os.path.dirname(blob), exist_ok=True)
+        if move:
+            os.replace(source, blob)
+        else:
+            try:
+                os.link(source, blob)
+            except OSError:
+                shutil.copyfile(source, blob)
+        return True
+
+    def add_file(self, source, name, url=None):
+        """Moves a downloaded file into the store under name. Returns the document's path."""
+        digest = file_digest(source)
+        with self._lock:
+            self._add_blob(source, digest, os.path.splitext(name)[1], move=True)
+            self._link(self.blob_path(digest), name)
+            self._record(name, digest, url)
+        return os.path.join(self.directory, name)
+
+    def link_url(self, url, name):
+        """Links name to content already downloaded from url. Returns the document's path, or None if url is new."""
+        with self._lock:
+            entry = self._urls.get(url)
+            if entry is None:
+                return None
+            if name not in self._names:
+                self._link(self.blob_path(entry['digest']), name)
+                self._record(name, entry['digest'], url)
+        return os.path.join(self.directory, name)
+
+    def add_from(self, store, name):
+        """Adds a document from another DocumentStore, replacing a stored document of the same name.
+
+        The other store's blob is hard linked where possible. Returns False if
+        the document was already stored with the same content.
+        """
+        entry = store.entry(name)
+        with self._lock:
+            current = self._names.get(name)
+            if current is not None and current['digest'] == entry['digest']:
+                return False
+            self._add_blob(store.blob_path(entry['digest']), entry['digest'], entry['extension'], move=False)
+            self._link(self.blob_path(entry['digest']), name)
+            self._record(name, entry['digest'], entry.get('url'))
+        return True
+
+    def migrate(self):
+        """Adds files in the documents directory that aren't in the manifest, in place.
+
+        A file whose content is new becomes its blob through a second hard link,
+        so nothing is copied; a duplicate is replaced by a link to the existing blob.
+        """
+        untracked = []
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if entry.is_file(follow_symlinks=False) and '_' in entry.name and entry.name not in self._names \
+                        and not entry.name.endswith('.part'):
+                    untracked.append(entry.name)
+        if not untracked:
+            return 0
+
+        logger.info('Adding %d document(s) to the document store', len(untracked))
+        duplicates = 0
+        for count, name in enumerate(sorted(untracked)):
+            path = os.path.join(self.directory, name)
+            digest = file_digest(path)
+            with self._lock:
+                if not self._add_blob(path, digest, os.path.splitext(name)[1], move=False):
+                    duplicates += 1
+                    self._link(self.blob_path(digest), name)
+                self._record(name, digest)
+            if (count + 1) % 1000 == 0:
+                logger.info('Added %d of %d document(s)', count + 1, len(untracked))
+        logger.info('Added %d document(s), %d duplicate(s) now stored once', len(untracked), duplicates)
+        return len(untracked)
+
+    def close(self):
+        self._manifest.close()
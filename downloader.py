@@ -0,0 +1,153 @@
+import os
+import time
+import logging
+import tempfile
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import metrics
+from governor import RequestGovernor
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+
+
+class DocumentDownloader:
+    """Downloads document files concurrently, independently of page scraping.
+
+    Each worker thread keeps its own keep-alive session so connections to the
+    document host are reused across files. Bodies are streamed to a temporary
+    file in the target directory and atomically renamed into place, so a crash
+    never leaves a truncated document under its final name. Given a
+    DocumentStore, finished files are handed to it instead, and urls it has
+    already stored are linked rather than downloaded again. Requests go
+    through the given RequestGovernor.
+    """
+
+    def __init__(self, workers=4, directory='./documents', chunk_size=CHUNK_SIZE, timeout=60, store=None,
+            governor=None):
+        self.workers = workers
+        self.directory = store.directory if store is not None else directory
+        self.store = store
+        self.governor = governor if governor is not None else RequestGovernor()
+        self.chunk_size = chunk_size
+        self.timeout = timeout
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='download')
+        self.queued = 0
+        self.active = 0
+        self.completed = 0
+        self.linked = 0
+        self.failed = 0
+        self.bytes_downloaded = 0
+        self.started_at = time.monotonic()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _session(self):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=4)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            self._local.session = session
+        return session
+
+    def submit(self, url, filename):
+        """Queues url for download to filename. Returns a future resolving to the file path."""
+        path = os.path.join(self.directory, filename)
+        with self._lock:
+            self.queued += 1
+        return self._executor.submit(self._download, url, path)
+
+    def _download(self, url, path):
+        with self._lock:
+            self.queued -= 1
+            self.active += 1
+        try:
+            filename = os.path.basename(path)
+            exists = filename in self.store if self.store is not None else os.path.exists(path)
+            if exists:
+                logger.debug('Document already exists: %s', filename)
+                metrics.count('documents', status='skipped')
+                return path
+            if self.store is not None and self.store.link_url(url, filename):
+                with self._lock:
+                    self.linked += 1
+                logger.debug('Linked %s to an identical document already downloaded', filename)
+                metrics.count('documents', status='linked')
+                return path
+
+            start = time.perf_counter()
+            size = 0
+            fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.part')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    get = lambda: self._session().get(url, stream=True, timeout=self.timeout)
+                    # the host's request slot is held until the whole body has been read
+                    with self.governor.stream(url, get, source='download') as response, response:
+                        response.raise_for_status()
+                        for chunk in response.iter_content(chunk_size=self.chunk_size):
+                            f.write(chunk)
+                            size += len(chunk)
+                            with self._lock:
+                                self.bytes_downloaded += len(chunk)
+                if self.store is not None:
+                    self.store.add_file(temp_path, filename, url)
+                else:
+                    os.replace(temp_path, path)
+            except BaseException:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                raise
+
+            with self._lock:
+                self.completed += 1
+            metrics.observe('download', time.perf_counter() - start)
+            metrics.count('documents', status='downloaded')
+            metrics.count('download_bytes', size)
+            logger.debug('Downloaded %s. %s', filename, self.report())
+            return path
+        except Exception as e:
+            with self._lock:
+                self.failed += 1
+            metrics.count('documents', status='failed')
+            logger.warning('Failed to download %s: %s', url, e)
+            raise
+        finally:
+            with self._lock:
+                self.active -= 1
+
+    def stats(self):
+        elapsed = max(time.monotonic() - self.started_at, 1e-9)
+        with self._lock:
+            return {
+                'completed': self.completed,
+                'linked': self.linked,
+                'failed': self.failed,
+                'active': self.active,
+                'queue_depth': self.queued,
+                'bytes': self.bytes_downloaded,
+                'bytes_per_second': self.bytes_downloaded / elapsed
+            }
+
+    def report(self):
+        stats = self.stats()
+        return f'{stats["bytes_per_second"] / 1024:.1f} KB/s, {stats["active"]} active, {stats["queue_depth"]} queued'
+
+    def close(self):
+        """Waits for queued downloads to finish and releases pooled connections."""
+        self._executor.shutdown(wait=True)
+        stats = self.stats()
+        logger.info('Downloads complete: %d file(s), %d linked, %d failed, %d bytes at %.1f KB/s', stats['completed'],
+            stats['linked'], stats['failed'], stats['bytes'], stats['bytes_per_second'] / 1024)
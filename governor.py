@@ -0,0 +1,244 @@
+import time
+import random
+import logging
+import threading
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+import requests
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# statuses that mean the server is overloaded or throttling us, rather than that the request was wrong
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+TRANSIENT_ERRORS = (requests.ConnectionError, requests.Timeout)
+
+
+class HostLimiter:
+    """Rate, concurrency and health limits for requests to one host.
+
+    A token bucket caps the request rate at `rate` per second with bursts of
+    up to `burst`. The number of requests in flight is capped by an AIMD limit:
+    it grows by one per limit's worth of fast successful responses and halves
+    (at most once a second) on a throttled, failed or slow response, staying
+    between min_concurrency and max_concurrency. After failure_threshold
+    consecutive failures the circuit opens: requests wait out the cooldown,
+    then a single probe request is let through. If it succeeds the circuit
+    closes with the limit back at its minimum; if not, the cooldown doubles.
+    """
+
+    def __init__(self, host, rate=10.0, burst=20, max_concurrency=8, min_concurrency=1, latency_target=10.0,
+            failure_threshold=10, cooldown=30.0, max_cooldown=600.0):
+        self.host = host
+        self.rate = rate
+        self.burst = burst
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.latency_target = latency_target
+        self.failure_threshold = failure_threshold
+        self.base_cooldown = cooldown
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.limit = float(max(min_concurrency, max_concurrency // 2))
+        self.in_flight = 0
+        self.tokens = float(burst)
+        self.failures = 0
+        self.state = 'closed'
+        self.opened_at = 0.0
+        self.paused_until = 0.0
+        self._refilled_at = time.monotonic()
+        self._decreased_at = 0.0
+        self._condition = threading.Condition()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self._refilled_at) * self.rate)
+        self._refilled_at = now
+
+    def _wait_time(self, now):
+        """Seconds until a request may start, 0 if it may start now, or None to wait for a release."""
+        if self.state == 'open':
+            remaining = self.opened_at + self.cooldown - now
+            if remaining > 0:
+                return remaining
+            # requests sent before the circuit opened have to finish before the probe goes out
+            return None if self.in_flight else 0
+        if self.state == 'half_open':
+            return None
+        if now < self.paused_until:
+            return self.paused_until - now
+        if self.in_flight >= int(self.limit):
+            return None
+        if self.rate:
+            self._refill(now)
+            if self.tokens < 1:
+                return (1 - self.tokens) / self.rate
+        return 0
+
+    def acquire(self):
+        """Blocks until a request to the host may start. Returns True if the request is the circuit's probe."""
+        with self._condition:
+            while True:
+                wait = self._wait_time(time.monotonic())
+                if wait == 0:
+                    break
+                self._condition.wait(wait)
+            probe = self.state == 'open'
+            if probe:
+                self.state = 'half_open'
+            if self.rate:
+                self.tokens -= 1
+            self.in_flight += 1
+            return probe
+
+    def release(self, probe, ok, latency, retry_after=None):
+        """Records the outcome of a request started with acquire()."""
+        with self._condition:
+            now = time.monotonic()
+            self.in_flight -= 1
+            if ok:
+                self.failures = 0
+                if latency > self.latency_target:
+                    self._decrease(now)
+                else:
+                    self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+                if probe:
+                    self._close()
+            else:
+                self.failures += 1
+                self._decrease(now)
+                if retry_after:
+                    self.paused_until = max(self.paused_until, now + retry_after)
+                if probe:
+                    self._open(now, self.cooldown * 2)
+                elif self.state == 'closed' and self.failures >= self.failure_threshold:
+                    self._open(now, self.base_cooldown)
+            self._condition.notify_all()
+
+    def _decrease(self, now):
+        # many requests in flight fail together. halve once for all of them rather than once each
+        if now - self._decreased_at >= 1.0:
+            self.limit = max(self.min_concurrency, self.limit / 2)
+            self._decreased_at = now
+
+    def _open(self, now, cooldown):
+        self.state = 'open'
+        self.opened_at = now
+        self.cooldown = min(cooldown, self.max_cooldown)
+        logger.warning('%d consecutive failed requests to %s. Pausing requests to it for %.0fs',
+            self.failures, self.host, self.cooldown)
+        metrics.count('circuit_opened', host=self.host)
+
+    def _close(self):
+        if self.state != 'closed':
+            logger.info('Requests to %s are succeeding again', self.host)
+        self.state = 'closed'
+        self.cooldown = self.base_cooldown
+        self.limit = float(self.min_concurrency)
+
+
+class RequestGovernor:
+    """Shared rate limiting, adaptive concurrency, retries and circuit breaking for outgoing requests.
+
+    Every request is made through request() (or stream(), for responses whose
+    body is read afterwards), which runs it under the limits of the url's host
+    (see HostLimiter) and retries throttled (429), server error (5xx) and
+    connection failures with jittered exponential backoff, honouring
+    Retry-After. The browser, http engine, downloader and api client all share
+    one governor, so their limits apply to the combined traffic to each host.
+    """
+
+    def __init__(self, rate=10.0, burst=20, max_concurrency=8, retries=4, backoff=1.0, max_backoff=60.0, **limits):
+        self.rate = rate
+        self.burst = burst
+        self.max_concurrency = max_concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.limits = limits
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    def host(self, url):
+        host = urlsplit(url).netloc
+        with self._lock:
+            if host not in self._hosts:
+                self._hosts[host] = HostLimiter(host, rate=self.rate, burst=self.burst,
+                    max_concurrency=self.max_concurrency, **self.limits)
+            return self._hosts[host]
+
+    def request(self, url, send, retry_on=(), source='http'):
+        """Calls send() for url within its host's limits, returning its result.
+
+        send makes the request, returning a response or raising. Responses with
+        a retryable status are retried, and returned as-is once retries run
+        out. Connection errors, timeouts, HTTPErrors with a retryable status
+        and any exception types in retry_on are retried, and raised once
+        retries run out. Any other exception is raised immediately.
+        """
+        with self.stream(url, send, retry_on, source) as result:
+            return result
+
+    @contextmanager
+    def stream(self, url, send, retry_on=(), source='http'):
+        """Like request(), but as a context manager holding the host's request slot until the block ends.
+
+        For streamed responses, whose body is read inside the block: the body
+        counts towards the limits and latency, and a connection error or
+        timeout while reading it counts as a failure.
+        """
+        limiter = self.host(url)
+        for attempt in range(self.retries + 1):
+            probe = limiter.acquire()
+            start = time.perf_counter()
+            try:
+                result = send()
+            except BaseException as e:
+                response = getattr(e, 'response', None)
+                retryable = (isinstance(e, TRANSIENT_ERRORS + tuple(retry_on))
+                    or getattr(response, 'status_code', None) in RETRY_STATUSES)
+                retry_after = _retry_after(response)
+                limiter.release(probe, not retryable, time.perf_counter() - start, retry_after)
+                if not retryable or attempt == self.retries:
+                    raise
+                error = e
+            else:
+                status = getattr(result, 'status_code', None)
+                retry_after = _retry_after(result)
+                if status == 429:
+                    metrics.count('throttled', host=limiter.host)
+                if status not in RETRY_STATUSES or attempt == self.retries:
+                    ok = status not in RETRY_STATUSES
+                    try:
+                        yield result
+                    except TRANSIENT_ERRORS + tuple(retry_on):
+                        ok = False
+                        raise
+                    finally:
+                        limiter.release(probe, ok, time.perf_counter() - start, retry_after)
+                    return
+                limiter.release(probe, False, time.perf_counter() - start, retry_after)
+                error = f'status code {status}'
+                result.close()
+
+            delay = min(self.max_backoff, max(self.backoff * 2 ** attempt * (0.5 + random.random()), retry_after or 0))
+            logger.warning('Request to %s failed (%s). Retrying in %.1fs', url, error, delay)
+            metrics.count('retries', source=source)
+            time.sleep(delay)
+
+
+def _retry_after(response):
+    """Seconds from a response's Retry-After header, which is either a number of seconds or an http date."""
+    value = getattr(response, 'headers', {}).get('Retry-After') if response is not None else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
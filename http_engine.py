@@ -0,0 +1,45 @@
+import requests
+from requests.adapters import HTTPAdapter
+from pages import PageNotRendered, parse_page
+from metrics import metrics
+from governor import RequestGovernor
+
+
+class HttpEngine:
+    """Browserless alternative to the Selenium scraping path.
+
+    Fetches pages over a pooled keep-alive session and parses them with
+    pages.TableParser, returning rows and links in the same shape as
+    pages.BrowserReader, so the same scraping code runs on either. Pages that
+    come back without any tables (i.e. rendered client side) raise
+    PageNotRendered so that callers can fall back to a browser. Requests go
+    through the given RequestGovernor.
+    """
+
+    def __init__(self, timeout=30, pool_size=8, governor=None):
+        self.timeout = timeout
+        self.governor = governor if governor is not None else RequestGovernor()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def page(self, url, require_tables=True):
+        with metrics.timer('page_load'):
+            response = self.governor.request(url, lambda: self.session.get(url, timeout=self.timeout))
+            response.raise_for_status()
+        metrics.count('page_bytes', len(response.content))
+        with metrics.timer('dom_extraction'):
+            page = parse_page(response.text, base_url=response.url)
+        if require_tables and page.tables == 0:
+            raise PageNotRendered(url)
+        return page
+
+    def rows(self, url):
+        return self.page(url).rows
+
+    def links(self, url):
+        return self.page(url, require_tables=False).links
+
+    def close(self):
+        self.session.close()
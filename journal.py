@@ -0,0 +1,44 @@
+import os
+import json
+
+
+def read_entries(path):
+    """Yields the entries of a json lines file, skipping any line torn by an interrupted write."""
+    with open(path, 'r') as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue
+
+
+def end_last_line(path, block_size=64 * 1024):
+    """Makes sure the file ends with a newline, so appended entries start on a line of their own.
+
+    A final line left without its newline by an interrupted write is kept
+    (and terminated) if it is a whole entry, and truncated away if not.
+    """
+    with open(path, 'rb+') as f:
+        end = f.seek(0, os.SEEK_END)
+        if end == 0:
+            return
+        f.seek(end - 1)
+        if f.read(1) == b'\n':
+            return
+        # find the start of the final line
+        start = end
+        while start > 0:
+            block_start = max(0, start - block_size)
+            f.seek(block_start)
+            newline = f.read(start - block_start).rfind(b'\n')
+            if newline != -1:
+                start = block_start + newline + 1
+                break
+            start = block_start
+        f.seek(start)
+        try:
+            json.loads(f.read(end - start))
+        except ValueError:
+            f.truncate(start)
+        else:
+            f.write(b'\n')
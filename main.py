@@ -1,15 +1,28 @@
 import os
 import csv
-import json
-import xlrd
-import requests
+import time
+import logging
+import threading
+from concurrent.futures import ProcessPoolExecutor, wait
 from argparse import ArgumentParser
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait, Select
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.chrome.options import Options
-from selenium.common.exceptions import TimeoutException
+from downloader import DocumentDownloader
+from document_store import DocumentStore
+from pdf_text import TEXT_ENCODING, TextCache, pdfs_without_text, convert_pdf, convert_pdfs
+from browser_pool import BrowserPool, CountingDriver
+from http_engine import HttpEngine
+from state import ExtractionState
+from store import ProjectStore
+from transform import iter_records, write_jsonl, counted
+from staff import DOCUMENT_ENCODING, extract_project, extract_projects, timed_extract_project
+from api import API_URL, ProjectsApi, ResponseCache, ApiError
+from pipeline import Pipeline, Stage
+from pages import (BASE_URL, BrowserReader, FallbackReader, document_detail_url, scrape_document_links,
+    scrape_metadata, build_document_details)
+from refresh import api_fields, document_keys, baseline_keys, fingerprint, new_rows, needs_refresh, prioritize
+from metrics import metrics, Reporter
+from governor import RequestGovernor
+from columnar import COMPRESSIONS, export_parquet
+from shard import SHARDS_DIRECTORY, parse_shard, shard_of, shard_directory, shard_directories, seed_shard, merge_shard
 
 document_search_terms = [
     'Project Appraisal Document',
@@ -30,7 +43,7 @@ parser.add_argument('-pid', '--project-id', type=str,
 parser.add_argument('-d', '--documents', action='store_true',
     help='fetches documents and/or metadata for a single document')
 parser.add_argument('-m', '--metadata', action='store_true',
-    help='fetches project metadata and adds details to the aggregated.json file')
+    help='fetches project metadata and adds details to the project records in projects.db')
 parser.add_argument('-s', '--staff-information', action='store_true', 
     help='fetches staff information for related project(s)')
 parser.add_argument('-dt', '--document-types',nargs='+', help='Fetch specific document-types, \
@@ -41,9 +54,9 @@ parser.add_argument('-hl', '--headless', default=True, help='run the script in h
     mode, does not require Chrome to be running. Default is True. Set to False to track \
     script execution from the browser')
 parser.add_argument('-agg', '--aggregate', action='store_true',
-    help='fetch project data from the World Bank API and add missing details to corresponding projects in aggregated.json')
-parser.add_argument('-x', '--xls-to-json', action='store_true', help='convert a World Bank xls data dump to a json file used for \
-    future aggregations. Run in cases where aggregated.json does not exist or is corrupted.')
+    help='fetch project data from the World Bank API and add missing details to corresponding projects in projects.db')
+parser.add_argument('-x', '--xls-to-json', action='store_true', help='convert a World Bank xls, xlsx or csv data dump to the project records used for \
+    future aggregations. Run in cases where projects.db does not exist or is corrupted.')
 parser.add_argument('-f', '--filepath', help='Defines a filepath for arguments that accept custom files \
     for example, python main.py --xls-to-json -f "./path_to_custom.xls"')
 parser.add_argument('-r', '--reset', action='store_true', help='resets the extraction status \
@@ -53,36 +66,80 @@ parser.add_argument('--stats', action='store_true', help='prints extraction stat
     metadata, and staff information')
 parser.add_argument('--retro', action='store_true', help='Updates extraction details with pre-existing \
     documents and/or data.')
+parser.add_argument('--download-workers', type=int, default=4, help='the number of documents to download \
+    concurrently while pages are being scraped. Default is 4')
+parser.add_argument('--engine', choices=['selenium', 'http'], default='selenium', help='how project pages \
+    are fetched. http fetches and parses pages without a browser, falling back to selenium for pages \
+    that are rendered client side. Default is selenium')
+parser.add_argument('--browsers', type=int, default=1, help='the number of browser sessions to scrape \
+    projects with in parallel. Default is 1')
+parser.add_argument('--staff-workers', type=int, help='the number of processes to extract staff \
+    information, and convert pdfs to text, with. Defaults to the number of cores')
+parser.add_argument('--api-page-size', type=int, default=500, help='the number of projects to request \
+    per api page when aggregating. Default is 500')
+parser.add_argument('--api-workers', type=int, default=4, help='the number of api pages to fetch \
+    concurrently when aggregating. Default is 4')
+parser.add_argument('--base-url', default=BASE_URL, help='the site project pages are read from, e.g. a \
+    local replay server when benchmarking. Default is https://projects.worldbank.org')
+parser.add_argument('--api-url', default=API_URL, help='the projects search api aggregated with -agg. \
+    Default is http://search.worldbank.org/api/v2/projects')
+parser.add_argument('-o', '--output', help='with --xls-to-json, writes the transformed projects to this \
+    path as json lines instead of projects.db')
+parser.add_argument('--refresh', action='store_true', help='re-checks projects for new documents, \
+    downloading only documents published since the last refresh. Active and recently updated \
+    projects are checked first; closed projects only when the api reports an update')
+parser.add_argument('--export', action='store_true', help='writes all project records from projects.db \
+    to aggregated.json, or to the path given with -f')
+parser.add_argument('--export-format', choices=['json', 'parquet'], default='json', help='parquet exports a \
+    directory of tables (aggregated_parquet, or the path given with -f): projects, with columns named as in \
+    keymap.json, and financing, documents and staff tables keyed by project id. Default is json')
+parser.add_argument('--compression', choices=COMPRESSIONS, default='zstd', help='the compression used for \
+    parquet exports. Default is zstd')
+parser.add_argument('--rate', type=float, default=10, help='the most requests per second sent to each \
+    host, across pages, downloads and api calls. 0 for no limit. Default is 10')
+parser.add_argument('--max-concurrency', type=int, default=8, help='the most requests in flight to each \
+    host. Concurrency adapts below this to the latency and errors seen. Default is 8')
+parser.add_argument('--retries', type=int, default=4, help='the number of times throttled, failed and \
+    timed out requests are retried, with jittered exponential backoff. Default is 4')
+parser.add_argument('--log-level', choices=['debug', 'info', 'warning', 'error'], default='info', help='debug \
+    includes the pages, documents and details found for every project. Default is info')
+parser.add_argument('--metrics-file', help='periodically writes per-stage timings, counters and progress to \
+    this path, in the Prometheus text format if it ends in .prom and as json otherwise')
+parser.add_argument('--metrics-interval', type=float, default=10, help='seconds between progress lines and \
+    metrics file updates. Default is 10')
+parser.add_argument('--stall-seconds', type=float, default=600, help='logs a warning when no project has \
+    completed for this many seconds. Default is 600')
+parser.add_argument('--shard', type=parse_shard, metavar='K/N', help='extracts only the Kth of N shards of the \
+    projects, e.g. 2/4, working in shards/K-of-N with its own projects.db, extraction details and documents. \
+    Shards can run at the same time, on one machine or several. Combine them with --merge')
+parser.add_argument('--merge', nargs='*', metavar='SHARD_DIRECTORY', help='merges shard directories (every \
+    directory in shards/ if none are given) into projects.db, extraction_details.json and ./documents, then \
+    exports aggregated.json')
 args = parser.parse_args()
+if args.shard and (args.aggregate or args.xls_to_json or args.merge is not None):
+    parser.error('--shard cannot be used with -agg, -x or --merge. Run them without --shard')
+
+logging.basicConfig(level=args.log_level.upper(), format='%(asctime)s %(levelname)s %(message)s')
+logging.getLogger('pypdf').setLevel(logging.ERROR)
+logger = logging.getLogger(__name__)
 
 
 def transform_xls_to_json():
     filepath = args.filepath if args.filepath else './World_Bank_Projects_downloaded_8_17_2021.xls'
-    print(f'Transforming {filepath} to json')
-    workbook = xlrd.open_workbook(filepath) 
-    sheet = workbook.sheet_by_index(0) 
-
-    abbr_keys = []
-    for cell in sheet.row(2):                                                                                      
-        abbr_keys.append(cell.value)
-
-    xls_data = {}
-    for i in range(3, sheet.nrows):                                                                                
-        project_id = sheet.row(i)[0].value;                                                                        
-        print('Tranforming project: ' + project_id)                                                              
-        xls_data[project_id] = {}                                                                                   
-        for index in range(len(sheet.row(i))):                                                                     
-            xls_data[project_id][abbr_keys[index]] = sheet.row(i)[index].value
-            
-    print(f'Transform complete. Processed {len(xls_data.keys())} projects')
-    with open('aggregated.json', 'w') as f:
-        f.write(json.dumps(xls_data))
-        
-        
+    records = counted(iter_records(filepath))
+    if args.output:
+        logger.info('Transforming %s to %s', filepath, args.output)
+        count = write_jsonl(records, args.output)
+    else:
+        logger.info('Transforming %s into projects.db', filepath)
+        count = projects.put_many(records)
+    logger.info('Transform complete. Processed %d projects', count)
+
+
 def parse_target_package():
-    print('got target package: ', args.target_package)
+    logger.debug('got target package: %s', args.target_package)
     with open(args.target_package[0], mode='r') as file:
-        print('Found target package. Extracting project project ids.')
+        logger.debug('Found target package. Extracting project project ids.')
         reader = csv.reader(file)
         count = 0
         pids = []
@@ -93,285 +150,591 @@ def parse_target_package():
             else:
                 pids.append(row[0])
                 # counter no longer necessary
-        print(f'Extraction complete. Found {len(pids)} projects in target package.')
+        logger.info('Extraction complete. Found %d projects in target package.', len(pids))
         return pids
 
 
-if not os.path.exists('aggregated.json') and not args.target_package and not args.project_id:
-    print('aggregated.json not found. creating it from default xls file')
-    transform_xls_to_json()
-    args.xls_to_json = False
+# with --shard, every file this run writes lives in the shard's directory instead
+work_directory = shard_directory(*args.shard) if args.shard else '.'
+os.makedirs(work_directory, exist_ok=True)
+
+# project records live in projects.db. aggregated.json is imported once, and can be
+# regenerated at any time with --export
+projects = ProjectStore(os.path.join(work_directory, 'projects.db'))
+# the projects targeted by this run, read on first use by commands that extract projects
+project_ids = None
+
+
+def load_projects():
+    """Populates an empty projects.db from aggregated.json, or from the default xls file."""
+    if args.shard:
+        return seed_projects()
+    if len(projects) == 0 and os.path.exists('aggregated.json'):
+        logger.info('Importing aggregated.json into projects.db')
+        logger.info('Imported %d projects', projects.import_json('aggregated.json'))
+    elif len(projects) == 0 and not args.target_package and not args.project_id:
+        logger.info('projects.db is empty. creating it from default xls file')
+        transform_xls_to_json()
+        args.xls_to_json = False
+
+
+def seed_projects():
+    """Copies the shard's projects and their extraction details from the canonical projects.db."""
+    with ProjectStore('projects.db', batch_size=1000) as canonical:
+        if len(canonical) == 0 and os.path.exists('aggregated.json'):
+            logger.info('Importing aggregated.json into projects.db')
+            canonical.import_json('aggregated.json')
+        if len(canonical) == 0:
+            parser.error('projects.db is empty. Load it with -x or -agg before running shards')
+        added = seed_shard(*args.shard, projects, extraction_details, canonical, ExtractionState('extraction_details.json'))
+    if added:
+        logger.info('Copied %d project(s) into shard %d/%d', added, *args.shard)
+
+
+def get_project_ids():
+    global project_ids
+    if project_ids is None:
+        load_projects()
+        if (args.project_id == None and not args.target_package):
+            project_ids = list(projects.keys())
+        elif args.target_package:
+            project_ids = parse_target_package()
+        else:
+            project_ids = [args.project_id]
+        if args.shard:
+            project_ids = [project_id for project_id in project_ids if shard_of(project_id, args.shard[1]) == args.shard[0]]
+    return project_ids
 
 
-projects = {}
-if not args.target_package and not args.project_id:
-    with open('aggregated.json', 'r') as f:
-        projects = json.loads(f.read())
+if args.document_types:
+    args.documents = True
 
 
-if (args.project_id == None and not args.target_package):
-    project_ids = list(projects.keys())
-elif args.target_package:
-    project_ids = parse_target_package()
-else:
-    project_ids = [args.project_id]
+extraction_details = ExtractionState(os.path.join(work_directory, 'extraction_details.json'))
+
+
+def create_driver():
+    # selenium is only imported when a browser is actually needed
+    from selenium import webdriver
+    from selenium.webdriver.chrome.options import Options
+    options = Options()
+    if (args.headless):
+        options.headless = True
+    driver = webdriver.Chrome(options=options)
+    # pages that hang raise a TimeoutException, which the governor retries
+    driver.set_page_load_timeout(60)
+    return CountingDriver(driver)
+
+
+# started on first use. with --browsers, each pool worker starts its own browser instead
+driver = None
+governor = RequestGovernor(rate=args.rate, max_concurrency=args.max_concurrency, retries=args.retries)
+http_engines = threading.local()
+downloader = None
+document_store = None
+text_cache = None
+# browser pool workers reach the getters below at the same time. reentrant, as the getters call each other
+getters_lock = threading.RLock()
 
+# (project_id, download futures) for projects whose files are still downloading.
+# projects are only marked as extracted once all of their files have landed.
+pending_document_downloads = []
+
+
+def get_driver():
+    global driver
+    if driver is None:
+        driver = create_driver()
+    return driver
 
-options = Options()
-if (args.headless):
-    options.headless = True
 
+def get_http_engine():
+    # requests sessions aren't guaranteed to be thread safe, so each thread gets its own engine
+    if getattr(http_engines, 'engine', None) is None:
+        http_engines.engine = HttpEngine(governor=governor)
+    return http_engines.engine
 
-if args.document_types:
-    args.documents = True
 
+def get_document_store():
+    # opening the store adds any documents missing from its manifest
+    global document_store
+    with getters_lock:
+        if document_store is None:
+            document_store = DocumentStore(os.path.join(work_directory, 'documents'))
+    return document_store
 
-if not os.path.exists('extraction_details.json'):
-    with open('extraction_details.json', 'w') as f:
-        f.write(json.dumps({ 'documents': [], 'metadata': [], 'staff_information': [] }))
 
+def get_text_cache():
+    global text_cache
+    with getters_lock:
+        if text_cache is None:
+            text_cache = TextCache(os.path.join(get_document_store().directory, '.text'))
+    return text_cache
 
-extraction_details = {}
-with open('extraction_details.json', 'r') as f:
-    extraction_details = json.loads(f.read())
 
+def get_downloader():
+    global downloader
+    with getters_lock:
+        if downloader is None:
+            downloader = DocumentDownloader(workers=args.download_workers, store=get_document_store(), governor=governor)
+    return downloader
 
-driver = webdriver.Chrome(options=options)
 
+def persist_completed_downloads(wait=False):
+    global downloader
+    if wait and downloader:
+        downloader.close()
+        downloader = None
 
-def get_project_documents(project_id, index, total):
-    if project_id in extraction_details['documents']:
-        print('Project documents already extracted for project: ', project_id)
-        return
-    
-    print(f'({index + 1}/{total}) Extracting documents for project: ', project_id)
-    document_detail_url = f'https://projects.worldbank.org/en/projects-operations/document-detail/{project_id}'
-    driver.get(document_detail_url)
-
-    table_rows = []
-    for tr in driver.find_elements(By.XPATH, '//tr'):
-        tds = tr.find_elements(By.TAG_NAME, 'td')
-        table_rows.append([td.text for td in tds])
-    print('Project has document types:', [i[3] for i in table_rows if len(i) == 4])
-
-    target_rows = []
-    for row in table_rows:
-        document_types = args.document_types if args.document_types else document_search_terms
-        print('Fetching document types:', document_types)
-        [target_rows.append(row) for data in row if data in document_types]
-
-    document_page_links = [driver.find_element(By.LINK_TEXT, data[0]).get_attribute('href') for data in target_rows]
-    print('Got document page links: ', document_page_links)
-
-    for document_page in document_page_links:
-        driver.get(document_page)
-
-        links = driver.find_elements(By.TAG_NAME, 'a')
-        link_urls = [link.get_attribute('href') for link in links]
-        document_file_links = [link for link in link_urls if link and (link.endswith('.txt') or link.endswith('.pdf'))]
-        print('Found documents: ', document_file_links)
-
-        for file_link in document_file_links:
-            filename = f'{project_id}_{os.path.basename(file_link)}'
-            os.system('mkdir documents') if not os.path.exists('./documents') else None
-            if not os.path.exists(f'./documents/{filename}'):
-                os.system(f"wget {file_link} -O './documents/{filename}'")
-            else:
-                print('Document already exists: ', filename)
+    for pending in list(pending_document_downloads):
+        project_id, futures = pending
+        if not all(future.done() for future in futures):
+            continue
+        pending_document_downloads.remove(pending)
+        if any(future.exception() for future in futures):
+            logger.warning('Some documents failed to download for project %s. Will re-attempt on future extractions', project_id)
+            metrics.count('projects', stage='documents', status='failed')
+            continue
+        extraction_details.add('documents', project_id)
+
+
+def queue_document_downloads(project_id, document_file_links):
+    downloads = []
+    for file_link in document_file_links:
+        filename = f'{project_id}_{os.path.basename(file_link)}'
+        if filename not in get_document_store():
+            downloads.append(get_downloader().submit(file_link, filename))
+        else:
+            logger.debug('Document already exists: %s', filename)
+            metrics.count('documents', status='skipped')
+    return downloads
+
+
+def browser_reader(driver):
+    from selenium.common.exceptions import TimeoutException
+    return BrowserReader(driver, governor, retry_on=(TimeoutException,))
+
+
+def page_reader(get_browser_driver):
+    """Returns a page reader for the selected engine. A browser is only started if a page needs one."""
+    if args.engine == 'http':
+        return FallbackReader(get_http_engine(), lambda: browser_reader(get_browser_driver()))
+    return browser_reader(get_browser_driver())
+
+
+def report_driver_calls(reader, stage, project_id):
+    if reader.calls:
+        logger.debug('Made %d driver calls extracting %s for project %s', reader.calls, stage, project_id)
+        metrics.count('driver_calls', reader.calls)
+
+
+def selected_document_types():
+    return args.document_types if args.document_types else document_search_terms
+
+
+def scrape_project_documents(driver, project_id):
+    """Finds a project's document files and queues them for download. Safe to run from browser workers."""
+    reader = page_reader(lambda: driver or get_driver())
+    document_types = selected_document_types()
+    logger.debug('Fetching document types: %s', document_types)
+    document_page_links, document_file_links = scrape_document_links(reader, project_id, document_types, base_url=args.base_url)
+    logger.debug('Got document page links: %s', document_page_links)
+    logger.debug('Found documents: %s', document_file_links)
+    report_driver_calls(reader, 'documents', project_id)
+    return document_page_links, queue_document_downloads(project_id, document_file_links)
 
+
+def record_project_documents(project_id, document_page_links, downloads):
     # document_page_links sometimes returns empty, even where documents exist.
     # marking it as not extracted to be re-attempted on future extractions
     if len(document_page_links) > 0:
-        extraction_details['documents'].append(project_id)
-        with open('extraction_details.json', 'w') as f:
-            print('Persisting extraction details: ', extraction_details)
-            f.write(json.dumps(extraction_details))
+        pending_document_downloads.append((project_id, downloads))
+    persist_completed_downloads()
+
+
+def get_project_documents(project_id, index, total):
+    if project_id in extraction_details['documents']:
+        logger.debug('Project documents already extracted for project: %s', project_id)
+        metrics.count('projects', stage='documents', status='skipped')
+        return
+
+    logger.info('(%d/%d) Extracting documents for project: %s', index + 1, total, project_id)
+    record_project_documents(project_id, *scrape_project_documents(None, project_id))
+
+
+def scrape_project_metadata(driver, project_id):
+    """Reads a project's financing tables and document listing. Safe to run from browser workers."""
+    reader = page_reader(lambda: driver or get_driver())
+    project_details, document_details = scrape_metadata(reader, project_id, base_url=args.base_url)
+    logger.debug('Found project details: %s', project_details)
+    logger.debug('Document details for project %s: %s', project_id, document_details)
+    report_driver_calls(reader, 'metadata', project_id)
+    return project_details, document_details
+
+
+def record_project_metadata(project_id, project_details, document_details):
+    projects.update(project_id, { 'addtional_details': project_details, 'project_documents': document_details },
+        on_commit=lambda: extraction_details.add('metadata', project_id))
 
 
 def get_project_metadata(project_id):
     if project_id in extraction_details['metadata']:
-        print('Project metadata already extracted for project: ', project_id)
+        logger.debug('Project metadata already extracted for project: %s', project_id)
+        metrics.count('projects', stage='metadata', status='skipped')
         return
 
-    print('Extracting metadata for project ', project_id)
-    
-    project_details_url = f'https://projects.worldbank.org/en/projects-operations/project-detail/{project_id}'
-    driver.get(project_details_url)
-
-    table_rows = []
-    for tr in driver.find_elements(bY.xpath, '//tr'):
-        tds = tr.find_elements(By.TAG_NAME, 'td')
-        row_object = {}
-        for td in tds:
-            data_key = td.get_attribute('data-th')
-            if len(data_key) > 0 and data_key.endswith(':'):
-                row_object = { **row_object, data_key[:len(data_key)-1]: td.text }
-        if len(row_object.keys()) > 0:
-            table_rows.append(row_object)
-
-    key_mapping = [
-        { 'FinancingPlan': ['Financier', 'Commitments']},
-        { 'TotalProjectFinancingTableOne': ['IBRD/IDA', 'Product Line' ]},
-        { 'TotalProjectFinancingTableTwo': ['Investment Project Financing', 'Lending Instrument']},
-        { 'SummaryStatusOfWBFinancing': ['Financier', 'Approval Date', 'Closing Date', 'Principal', 'Disbursed', 'Repayments', 'Interest, Charges & Fees']},
-        { 'DetailedFinancialActivity': ['Period', 'Financier', 'Transaction Type', 'Amount (US$)']}
-    ]
-
-    project_details = {
-        'FinancingPlan': [],
-        'TotalProjectFinancingTableOne': [],
-        'TotalProjectFinancingTableTwo': [],
-        'SummaryStatusOfWBFinancing': [],
-        'DetailedFinancialActivity': []
-    }
-
-    # append details accordingly
-    for row in table_rows:
-        for project_detail in key_mapping:
-            if sorted(list(row.keys())) == sorted(list(project_detail.values())[0]):
-                project_details[(list(project_detail.keys())[0])].append(row)
-
-    print('Found project details: ', project_details)
-    projects[project_id]['addtional_details'] = project_details
-    
-    document_details_url = f'https://projects.worldbank.org/en/projects-operations/document-detail/{project_id}'
-    driver.get(document_details_url)
-
-    table_rows = []
-    for tr in driver.find_elements(By.XPATH, '//tr'):
-        tds = tr.find_elements(By.TAG_NAME, 'td')
-        table_rows.append([td.text for td in tds])
-
-    document_details = []
-    [document_details.append({
-        'document_name': row[0],
-        'date': row[1],
-        'report_number': row[2],
-        'document_type': row[3],
-        'document_url': driver.find_elements(By.LINK_TEXT, row[0]).get_attribute('href')
-    }) for row in table_rows if len(row) == 4]   
-    print(f'Document details for project {project_id}: ', document_details)
-
-    projects[project_id]['project_documents'] = document_details
-
-    with open('aggregated.json', 'w') as f:
-        f.write(json.dumps(projects))
-
-    extraction_details['metadata'].append(project_id)
-    with open('extraction_details.json', 'w') as f:
-        print('Persisting extraction details: ', extraction_details)
-        f.write(json.dumps(extraction_details))
-
-
-# Extracts staff information from downloaded document txt files.
-# This function assumes that the project documents have already been extracted.
-# if not, this is achievable by adding the -d flag to any command that extracts staff information
-def extract_staff_information(project_id):
-    if project_id in extraction_details['staff_information']:
-        print('Project staff information already extracted for project: ', project_id)
-        return
+    logger.info('Extracting metadata for project %s', project_id)
+    record_project_metadata(project_id, *scrape_project_metadata(None, project_id))
+
+
+# Runs a scraping stage over a pool of browsers. Workers only scrape; this (coordinating)
+# thread records every result, so the extraction state and project store have a single writer.
+def run_browser_pool(stage, target_ids):
+    scrape, record = {
+        'documents': (scrape_project_documents, record_project_documents),
+        'metadata': (scrape_project_metadata, record_project_metadata)
+    }[stage]
+    pending_ids = [project_id for project_id in target_ids if project_id not in extraction_details[stage]]
+    logger.info('Extracting %s for %d project(s) with %d browsers. %d already extracted', stage, len(pending_ids),
+        args.browsers, len(target_ids) - len(pending_ids))
+    metrics.count('projects', len(target_ids) - len(pending_ids), stage=stage, status='skipped')
+    metrics.advance(len(target_ids) - len(pending_ids))
+
+    with BrowserPool(args.browsers, create_driver) as pool:
+        for index, (project_id, result, error) in enumerate(pool.map(scrape, pending_ids)):
+            metrics.advance()
+            if error:
+                logger.warning('(%d/%d) Failed to extract %s for project %s: %s', index + 1, len(pending_ids), stage, project_id, error)
+                metrics.count('projects', stage=stage, status='failed')
+                continue
+            logger.info('(%d/%d) Extracted %s for project: %s', index + 1, len(pending_ids), stage, project_id)
+            record(project_id, *result)
 
-    print('Extracting staff information for project ', project_id)
-    search_terms = ['Vice President:', 'Country Director:', 'Sector Manager:', 'Task Team Leader:', 'Name:']
-    staff_information = {}
-    project_text_documents = [x for x in os.listdir('./documents') if x.startswith(project_id) and x.endswith('.txt')]
 
-    if len(project_text_documents) == 0:
-        print(f'Project documents not found for project: {project_id}. Skipping')
-        return
+def extract_documents(target_ids):
+    metrics.start_stage('documents', len(target_ids))
+    if args.browsers > 1 and args.engine == 'selenium':
+        return run_browser_pool('documents', target_ids)
+    for index, project_id in enumerate(target_ids):
+        get_project_documents(project_id, index, len(target_ids))
+        metrics.advance()
 
-    for filename in project_text_documents:
-        with open(f'./documents/{filename}', 'r', encoding='latin1') as f:
-            for line in f.readlines():
-                for search_term in search_terms:
-                    if search_term in line:
-                        line_data = ' '.join(line.split()).split(':')
-                        if len(line_data) == 2: # filters out keys with missing values
-                            key, value = line_data
-                            staff_information[key] = value
 
-    print(f'Found staff information for project {project_id}: ', staff_information)
-    projects[project_id]['staff_information'] = staff_information
-    with open('aggregated.json', 'w') as f:
-        f.write(json.dumps(projects))
+def extract_metadata(target_ids):
+    metrics.start_stage('metadata', len(target_ids))
+    if args.browsers > 1 and args.engine == 'selenium':
+        return run_browser_pool('metadata', target_ids)
+    for project_id in target_ids:
+        get_project_metadata(project_id)
+        metrics.advance()
 
-    extraction_details['staff_information'].append(project_id)
-    with open('extraction_details.json', 'w') as f:
-        print('Persisting extraction details: ', extraction_details)
-        f.write(json.dumps(extraction_details))
 
+# (path, digest) of a project's pdfs that weren't also downloaded as text
+def project_pdfs(project_id):
+    store = get_document_store()
+    return [(os.path.join(store.directory, name), store.digest(name)) for name in pdfs_without_text(store.names(project_id))]
 
-# Fetches api data and merges it with the xls-derived data in aggregated.json
-def fetch_api_data(number_projects):
-    print(f'Fetching api data for {number_projects} project(s)')
-    api_response = requests.get(f'http://search.worldbank.org/api/v2/projects?format=json&source=IBRD&rows={number_projects}')
-    print(f'Fetch project api data returned status code {api_response.status_code}', api_response)
-    if api_response.status_code == 200:
+
+# (path, encoding) of a project's text documents, plus the converted text of its pdfs without a text version
+def project_text_documents(project_id):
+    cache = get_text_cache()
+    return [(path, DOCUMENT_ENCODING) for path in get_document_store().paths(project_id, '.txt')] + \
+        [(cache.path(digest), TEXT_ENCODING) for _, digest in project_pdfs(project_id) if digest in cache]
+
+
+def convert_project_pdfs(target_ids):
+    cache = get_text_cache()
+    tasks = [(path, digest) for project_id in target_ids for path, digest in project_pdfs(project_id) if digest not in cache]
+    if not tasks:
+        return
+    logger.info('Converting %d pdf document(s) to text', len(tasks))
+    start = time.monotonic()
+    pages = sum(converted for _, _, converted in convert_pdfs(tasks, cache, workers=args.staff_workers))
+    logger.info('Converted %d page(s) in %.1fs', pages, time.monotonic() - start)
+
+
+# Extracts staff information from downloaded text documents, converting pdfs to text first.
+# This function assumes that the project documents have already been extracted.
+# if not, this is achievable by adding the -d flag to any command that extracts staff information
+def extract_staff_information(target_ids):
+    metrics.start_stage('staff_information', len(target_ids))
+    pending_ids = [project_id for project_id in target_ids if project_id not in extraction_details['staff_information']]
+    if len(pending_ids) < len(target_ids):
+        logger.info('Staff information already extracted for %d project(s)', len(target_ids) - len(pending_ids))
+        metrics.count('projects', len(target_ids) - len(pending_ids), stage='staff_information', status='skipped')
+        metrics.advance(len(target_ids) - len(pending_ids))
+
+    convert_project_pdfs(pending_ids)
+    tasks = []
+    for project_id in pending_ids:
+        documents = project_text_documents(project_id)
+        if not documents:
+            logger.info('Project documents not found for project: %s. Skipping', project_id)
+            metrics.count('projects', stage='staff_information', status='no_documents')
+            metrics.advance()
+            continue
+        tasks.append((project_id, documents))
+
+    logger.info('Extracting staff information for %d project(s)', len(tasks))
+    for project_id, staff_information in extract_projects(tasks, workers=args.staff_workers):
+        record_staff_information(project_id, staff_information)
+        metrics.advance()
+
+
+def record_staff_information(project_id, staff_information):
+    logger.debug('Found staff information for project %s: %s', project_id, staff_information)
+    projects.update(project_id, { 'staff_information': staff_information },
+        on_commit=lambda: extraction_details.add('staff_information', project_id))
+
+
+# Runs documents, metadata and staff extraction as one pipeline: pages are scraped, files
+# downloaded and text documents searched at the same time, over bounded queues. A project's
+# document-detail page is visited once for both its documents and its metadata.
+def run_pipeline(target_ids):
+    stages = ('documents', 'metadata', 'staff_information')
+    pending_ids = [project_id for project_id in target_ids if any(project_id not in extraction_details[stage] for stage in stages)]
+    logger.info('Running extraction pipeline on %d project(s). %d already fully extracted', len(pending_ids),
+        len(target_ids) - len(pending_ids))
+    metrics.start_stage('pipeline', len(target_ids))
+    metrics.advance(len(target_ids) - len(pending_ids))
+
+    document_types = selected_document_types()
+    browsers = BrowserPool(args.browsers, create_driver)
+    staff_executor = ProcessPoolExecutor(max_workers=args.staff_workers)
+    get_downloader()
+
+    def scrape_pages(reader, project_id):
+        project = { 'project_id': project_id }
+        needs_documents = project_id not in extraction_details['documents']
+        needs_metadata = project_id not in extraction_details['metadata']
+        if needs_documents or needs_metadata:
+            rows = reader.rows(document_detail_url(project_id, args.base_url))
+            if needs_metadata:
+                project['metadata'] = scrape_metadata(reader, project_id, rows, args.base_url)
+            if needs_documents:
+                project['documents'] = scrape_document_links(reader, project_id, document_types, rows, args.base_url)
+        report_driver_calls(reader, 'pages', project_id)
+        return project
+
+    def scrape(project_id):
+        if args.engine == 'http':
+            return scrape_pages(page_reader(browsers.driver), project_id)
+        return browsers.call(lambda driver, project_id: scrape_pages(browser_reader(driver), project_id), project_id)
+
+    def download(project):
+        project_id = project['project_id']
+        if 'documents' in project:
+            document_page_links, document_file_links = project['documents']
+            downloads = queue_document_downloads(project_id, document_file_links)
+            wait(downloads)
+            failed = any(future.exception() for future in downloads)
+            # see record_project_documents for why projects without document page links aren't marked
+            project['downloaded'] = len(document_page_links) > 0 and not failed
+        return project
+
+    def extract(project):
+        project_id = project['project_id']
+        if project_id in extraction_details['staff_information']:
+            return project
+        cache = get_text_cache()
+        conversions = [staff_executor.submit(convert_pdf, cache.directory, path, digest)
+            for path, digest in project_pdfs(project_id) if digest not in cache]
+        wait(conversions)
+        for future in conversions:
+            if future.exception():
+                logger.warning('Failed to convert a pdf for project %s to text: %s', project_id, future.exception())
+            else:
+                metrics.count('pdf_pages_converted', future.result()[2])
+        documents = project_text_documents(project_id)
+        if documents:
+            _, project['staff_information'], seconds = staff_executor.submit(timed_extract_project, project_id,
+                documents).result()
+            metrics.observe('parse', seconds)
+        return project
+
+    pipeline = Pipeline([
+        Stage('scrape', scrape, workers=args.browsers),
+        Stage('download', download, workers=args.download_workers),
+        Stage('extract', extract, workers=args.staff_workers or os.cpu_count())
+    ])
+    try:
+        for stage, item, project, error in pipeline.run(pending_ids):
+            if error:
+                project_id = item if stage == 'scrape' else item['project_id']
+                logger.warning('Failed to %s project %s: %s', stage, project_id, error)
+                metrics.count('projects', stage=stage, status='failed')
+                metrics.advance()
+                continue
+            project_id = project['project_id']
+            if stage == 'scrape' and 'metadata' in project:
+                record_project_metadata(project_id, *project['metadata'])
+            if stage == 'download' and project.get('downloaded'):
+                extraction_details.add('documents', project_id)
+            if stage == 'extract':
+                metrics.advance()
+                if 'staff_information' in project:
+                    record_staff_information(project_id, project['staff_information'])
+                elif project_id not in extraction_details['staff_information']:
+                    logger.info('Project documents not found for project: %s. Skipping staff information', project_id)
+    finally:
+        browsers.close()
+        staff_executor.shutdown()
+        persist_completed_downloads(wait=True)
+    logger.info(pipeline.report())
+
+
+# Re-checks a project for documents published since it was extracted. The project's document
+# table is fingerprinted; only new documents are downloaded when the table has changed
+def refresh_project(project_id, record, saved, document_types):
+    reader = page_reader(get_driver)
+    rows = reader.rows(document_detail_url(project_id, args.base_url))
+    keys = document_keys(rows)
+    current = fingerprint(keys)
+    added_rows = [] if saved and saved['fingerprint'] == current else \
+        new_rows(rows, saved['document_keys'] if saved else baseline_keys(record))
+    if len(added_rows) == 0:
+        projects.put_fingerprint(project_id, current, keys, record.get('lastupdatedate'))
+        return False
+
+    logger.info('Found %d new document(s) for project %s', len(added_rows), project_id)
+    document_page_links, document_file_links = scrape_document_links(reader, project_id, document_types, added_rows, args.base_url)
+    downloads = queue_document_downloads(project_id, document_file_links)
+    wait(downloads)
+    report_driver_calls(reader, 'documents', project_id)
+    if any(future.exception() for future in downloads):
+        logger.warning('Some documents failed to download for project %s. Will re-attempt on the next refresh', project_id)
+        return False
+
+    projects.update(project_id, { 'project_documents': build_document_details(rows) })
+    if len(document_page_links) > 0:
+        extraction_details.add('documents', project_id)
+    if downloads:
+        convert_project_pdfs([project_id])
+        record_staff_information(project_id, extract_project(project_id, project_text_documents(project_id))[1])
+    # the fingerprint is only saved once the project's new data is committed
+    projects.commit()
+    projects.put_fingerprint(project_id, current, keys, record.get('lastupdatedate'))
+    return True
+
+
+def refresh_projects(target_ids, number_projects=None):
+    # every target is ranked before taking number_projects, so -n picks the most active and recently updated
+    targets = prioritize([(project_id, projects.get(project_id, {})) for project_id in target_ids])[:number_projects]
+    document_types = selected_document_types()
+    checked, updated = 0, 0
+    logger.info('Refreshing %d project(s), active and recently updated projects first', len(targets))
+    metrics.start_stage('refresh', len(targets))
+
+    for index, (project_id, record) in enumerate(targets):
+        saved = projects.get_fingerprint(project_id)
+        if not needs_refresh(record, saved):
+            metrics.count('projects', stage='refresh', status='skipped')
+            metrics.advance()
+            continue
+        checked += 1
+        logger.info('(%d/%d) Checking project %s for new documents', index + 1, len(targets), project_id)
         try:
-            api_data = api_response.json()
+            updated += refresh_project(project_id, record, saved, document_types)
         except Exception as e:
-            print('Error: ', e)
-            return
-
-        api_projects = api_data['projects']
-        for project_id in api_projects.keys():
-            print('Aggregating data for project: ', project_id)                                                                          
-            project = projects[project_id]                                                                      
-            api_project = api_projects[project_id]                                                                  
-            for key in api_project.keys():                                                                          
-                if key not in project.keys():                                                                   
-                    project[key] = api_project[key]
-
-        with open('aggregated.json', 'w') as f:
-            f.write(json.dumps(projects))
-        print('Data aggregation complete. Saved to aggregated.json')
-
-    
+            logger.warning('Failed to refresh project %s: %s', project_id, e)
+            metrics.count('projects', stage='refresh', status='failed')
+        metrics.advance()
+
+    persist_completed_downloads(wait=True)
+    logger.info('Refresh complete. Checked %d of %d project(s), %d had new documents', checked, len(targets), updated)
+
+
+# Fetches api data and merges it with the xls-derived data in projects.db
+def fetch_api_data(number_projects):
+    logger.info('Fetching api data for %d project(s)', number_projects)
+    metrics.start_stage('aggregate', number_projects)
+    api = ProjectsApi(url=args.api_url, page_size=args.api_page_size, workers=args.api_workers,
+        cache=ResponseCache('.api_cache'), governor=governor)
+    aggregated = 0
+    try:
+        for api_projects in api.pages(number_projects):
+            for project_id, api_project in api_projects.items():
+                projects.update(project_id, api_fields(projects.get(project_id, {}), api_project))
+            aggregated += len(api_projects)
+            metrics.advance(len(api_projects))
+            logger.info('Aggregated data for %d project(s)', aggregated)
+    except ApiError as e:
+        logger.error('Error: %s', e)
+    finally:
+        projects.commit()
+    logger.info('Data aggregation complete. Saved to projects.db (%d page(s) fetched, %d unchanged since the last run)',
+        api.fetched, api.not_modified)
+
+
 def reset_extraction_details():
     if args.documents:
-        extraction_details['documents'] = []
+        extraction_details.reset('documents')
     if args.metadata:
-        extraction_details['metadata'] = []
+        extraction_details.reset('metadata')
     if args.staff_information:
-        extraction_details['staff_information'] = []
+        extraction_details.reset('staff_information')
 
-    with open('extraction_details.json', 'w') as f:
-        f.write(json.dumps(extraction_details))
-    print('Extraction details successfully (re)set')
+    logger.info('Extraction details successfully (re)set')
 
 
 def retroactively_populate_extraction_details():
-    print('Updating extraction details...')
-    
+    logger.info('Updating extraction details...')
+    load_projects()
+
     if args.documents:
-        for filename in os.listdir('./documents'):
-            project_id = filename[:filename.find('_')]
-            if project_id not in extraction_details['documents']:
-                extraction_details['documents'].append(project_id)
+        extraction_details.add_many('documents', get_document_store().project_ids())
 
     if args.metadata:
-        [
-            extraction_details['metadata'].append(project_id) for project_id in projects.keys() if 'project_documents' in projects[project_id].keys() and \
-                ('additional_details' in projects[project_id].keys() or 'addtional_details' in projects[project_id].keys()) \
-                and project_id not in extraction_details['metadata']   # ^ atonement for an old typo
-        ]
+        extraction_details.add_many('metadata', [
+            project_id for project_id, project in projects.items() if 'project_documents' in project.keys() and \
+                ('additional_details' in project.keys() or 'addtional_details' in project.keys())
+        ])                                                  # ^ atonement for an old typo
 
     if args.staff_information:
-        [
-            extraction_details['staff_information'].append(project_id) for project_id in projects.keys() \
-                if 'staff_information' in projects[project_id].keys() and project_id not in extraction_details['staff_information']
-        ]
+        extraction_details.add_many('staff_information', [
+            project_id for project_id, project in projects.items() if 'staff_information' in project.keys()
+        ])
+
+    logger.info('Extraction details successfully updated')
 
-    with open('extraction_details.json', 'w') as f:
-        f.write(json.dumps(extraction_details))
-    print('Extraction details successfully updated')
+
+def export_projects():
+    if args.export_format == 'parquet':
+        directory = args.filepath if args.filepath else os.path.join(work_directory, 'aggregated_parquet')
+        logger.info('Exporting projects to %s', directory)
+        rows = export_parquet(projects.items(), directory, compression=args.compression)
+        logger.info('Exported %d projects, %d financing rows, %d documents and %d staff', rows['projects'],
+            rows['financing'], rows['documents'], rows['staff'])
+        return
+    filepath = args.filepath if args.filepath else os.path.join(work_directory, 'aggregated.json')
+    logger.info('Exporting projects to %s', filepath)
+    logger.info('Exported %d projects', projects.export_json(filepath))
+
+
+def merge_shards():
+    directories = args.merge or shard_directories()
+    if not directories:
+        logger.info('No shards to merge in %s', SHARDS_DIRECTORY)
+        return
+    load_projects()
+    for directory in directories:
+        logger.info('Merging %s', directory)
+        merged = merge_shard(directory, projects, extraction_details, get_document_store(), get_text_cache())
+        logger.info('Merged %d project record(s) (%d conflicting field(s), kept from the shard), %d extraction(s), '
+            '%d document(s) and %d converted text(s)', merged['projects'], merged['conflicts'], merged['extracted'],
+            merged['documents'], merged['texts'])
+    export_projects()
 
 
 def extraction_stats():
-    total_projects = len(projects.keys())
-    print(f'Documents: {len(extraction_details["documents"])}/{total_projects}')
-    print(f'Metadata: {len(extraction_details["metadata"])}/{total_projects}')
-    print(f'Staff information: {len(extraction_details["staff_information"])}/{total_projects}')
+    # a workspace being upgraded has aggregated.json but no projects.db yet
+    if len(projects) == 0:
+        load_projects()
+    total_projects = len(projects)
+    counts = extraction_details.counts()
+    print(f'Documents: {counts["documents"]}/{total_projects}')
+    print(f'Metadata: {counts["metadata"]}/{total_projects}')
+    print(f'Staff information: {counts["staff_information"]}/{total_projects}')
 
 
 def extraction_handler():
@@ -381,32 +744,46 @@ def extraction_handler():
 
     if args.stats: return extraction_stats()
 
-    number_projects = len(projects.keys()) if args.all_projects else args.number_projects
-    print(f'Running extraction script on {1 if args.project_id else number_projects} project(s)')
+    if args.export:
+        load_projects()
+        return export_projects()
+
+    if args.merge is not None: return merge_shards()
+
+    if args.xls_to_json and not any((args.documents, args.metadata, args.staff_information, args.aggregate,
+            args.all_projects, args.refresh)):
+        return transform_xls_to_json()
+
+    project_ids = get_project_ids()
+
+    if args.refresh: return refresh_projects(project_ids, None if args.all_projects else args.number_projects)
+
+    number_projects = len(project_ids) if args.all_projects else args.number_projects
+    logger.info('Running extraction script on %d project(s)', 1 if args.project_id else number_projects)
 
     if args.all_projects and not args.documents and not args.metadata and not args.aggregate and not args.reset \
         and not args.staff_information:
-        [get_project_documents(project_ids[i], i, number_projects) for i in range(0, number_projects)]
-        [get_project_metadata(project_ids[i]) for i in range(0, number_projects)]
-        [extract_staff_information(project_ids[i]) for i in range(0, number_projects)]
+        run_pipeline(project_ids[:number_projects])
 
     if args.documents and args.project_id:
-        get_project_documents(args.project_id, 0, 1)
+        extract_documents([args.project_id])
 
     if args.documents and args.project_id == None:
-        [get_project_documents(project_ids[i], i, number_projects) for i in range(0, number_projects)]
+        extract_documents(project_ids[:number_projects])
+
+    if args.documents: persist_completed_downloads(wait=True)
 
     if args.metadata and args.project_id:
-        get_project_metadata(args.project_id)
+        extract_metadata([args.project_id])
 
     if args.metadata and args.project_id == None:
-        [get_project_metadata(project_ids[i]) for i in range(0, number_projects)]
+        extract_metadata(project_ids[:number_projects])
 
     if args.staff_information and args.project_id:
-        extract_staff_information(args.project_id)
+        extract_staff_information([args.project_id])
 
     if args.staff_information and not args.project_id:
-        [extract_staff_information(project_ids[i]) for i in range(0, number_projects)]
+        extract_staff_information(project_ids[:number_projects])
 
     if args.xls_to_json: transform_xls_to_json()
 
@@ -415,4 +792,11 @@ def extraction_handler():
 
 if __name__ == '__main__':
     # encapsulated for the benefit of using return statements
-    extraction_handler()
+    try:
+        with Reporter(metrics, args.metrics_file, args.metrics_interval, args.stall_seconds):
+            extraction_handler()
+    finally:
+        projects.close()
+        extraction_details.close()
+        if document_store is not None:
+            document_store.close()
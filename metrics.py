@@ -0,0 +1,237 @@
+import os
+import json
+import time
+import random
+import logging
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# the timings every extraction reports, whether or not a run touched them
+TIMINGS = ('page_load', 'dom_extraction', 'download', 'parse', 'persist')
+SAMPLE_SIZE = 1024
+
+
+class Timing:
+    """Count, total and max of a timed step, plus a uniform sample of durations for percentiles."""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples = []
+
+    def observe(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        if len(self.samples) < SAMPLE_SIZE:
+            self.samples.append(seconds)
+        else:
+            # reservoir sampling keeps every duration equally likely to be in the sample
+            index = random.randrange(self.count)
+            if index < SAMPLE_SIZE:
+                self.samples[index] = seconds
+
+    def quantile(self, fraction):
+        if not self.samples:
+            return 0.0
+        samples = sorted(self.samples)
+        return samples[min(len(samples) - 1, int(round(fraction * (len(samples) - 1))))]
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'seconds': round(self.total, 3),
+            'mean': round(self.total / self.count, 4) if self.count else 0.0,
+            'p50': round(self.quantile(0.5), 4),
+            'p99': round(self.quantile(0.99), 4),
+            'max': round(self.max, 4)
+        }
+
+
+class Metrics:
+    """Timings, counters and progress for a run, shared by every module through metrics.metrics.
+
+    Timings are per step (see TIMINGS) and counters are keyed by name and
+    optional labels, e.g. count('projects', stage='documents', status='skipped'). All
+    methods are thread safe. Progress covers one stage at a time: the number
+    of projects done out of the number targeted, from which the rate and ETA
+    are derived.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+        self.timings = { name: Timing() for name in TIMINGS }
+        self.counters = {}
+        self.stage = None
+        self.total = 0
+        self.done = 0
+        self.stage_started = None
+        self.last_progress = time.monotonic()
+
+    def count(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, seconds):
+        with self._lock:
+            self.timings.setdefault(name, Timing()).observe(seconds)
+
+    @contextmanager
+    def timer(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def start_stage(self, stage, total):
+        with self._lock:
+            self.stage = stage
+            self.total = total
+            self.done = 0
+            self.stage_started = time.monotonic()
+            self.last_progress = self.stage_started
+
+    def advance(self, projects=1):
+        with self._lock:
+            self.done += projects
+            self.last_progress = time.monotonic()
+
+    def stalled_for(self):
+        """Seconds since a project was last completed, while a stage is running."""
+        with self._lock:
+            if self.stage is None or self.done >= self.total:
+                return 0.0
+            return time.monotonic() - self.last_progress
+
+    def progress(self):
+        with self._lock:
+            if self.stage is None:
+                return None
+            elapsed = max(time.monotonic() - self.stage_started, 1e-9)
+            rate = self.done / elapsed
+            remaining = max(self.total - self.done, 0)
+            return {
+                'stage': self.stage,
+                'done': self.done,
+                'total': self.total,
+                'projects_per_second': round(rate, 3),
+                'eta_seconds': round(remaining / rate) if rate else None
+            }
+
+    def progress_line(self):
+        progress = self.progress()
+        if progress is None:
+            return None
+        percent = progress['done'] / progress['total'] * 100 if progress['total'] else 100.0
+        eta = format_duration(progress['eta_seconds']) if progress['eta_seconds'] is not None else 'unknown'
+        return (f'{progress["stage"]}: {progress["done"]}/{progress["total"]} ({percent:.1f}%), '
+                f'{progress["projects_per_second"] * 60:.1f} projects/min, ETA {eta}')
+
+    def snapshot(self):
+        with self._lock:
+            timings = { name: timing.summary() for name, timing in self.timings.items() }
+            counters = [{ 'name': name, 'labels': dict(labels), 'value': value }
+                for (name, labels), value in sorted(self.counters.items())]
+        return {
+            'time': round(time.time(), 3),
+            'uptime_seconds': round(time.time() - self.started_at, 3),
+            'progress': self.progress(),
+            'timings': timings,
+            'counters': counters
+        }
+
+    def prometheus(self):
+        """Renders the snapshot in the Prometheus text exposition format."""
+        snapshot = self.snapshot()
+        lines = []
+        for name, timing in snapshot['timings'].items():
+            metric = f'worldbank_{name}_seconds'
+            lines.append(f'# TYPE {metric} summary')
+            lines.append(f'{metric}{{quantile="0.5"}} {timing["p50"]}')
+            lines.append(f'{metric}{{quantile="0.99"}} {timing["p99"]}')
+            lines.append(f'{metric}_sum {timing["seconds"]}')
+            lines.append(f'{metric}_count {timing["count"]}')
+        for counter in snapshot['counters']:
+            labels = ','.join(f'{key}="{value}"' for key, value in counter['labels'].items())
+            lines.append(f'worldbank_{counter["name"]}_total{{{labels}}} {counter["value"]}')
+        progress = snapshot['progress']
+        if progress:
+            labels = f'{{stage="{progress["stage"]}"}}'
+            lines.append(f'worldbank_projects_done{labels} {progress["done"]}')
+            lines.append(f'worldbank_projects_targeted{labels} {progress["total"]}')
+            if progress['eta_seconds'] is not None:
+                lines.append(f'worldbank_eta_seconds{labels} {progress["eta_seconds"]}')
+        return '\n'.join(lines) + '\n'
+
+    def write(self, filepath):
+        """Atomically writes the metrics to filepath, as Prometheus text for .prom files and json otherwise."""
+        content = self.prometheus() if filepath.endswith('.prom') else json.dumps(self.snapshot(), indent=2)
+        temp_path = filepath + '.tmp'
+        with open(temp_path, 'w') as f:
+            f.write(content)
+        os.replace(temp_path, filepath)
+
+
+def format_duration(seconds):
+    hours, remainder = divmod(int(seconds), 3600)
+    minutes, seconds = divmod(remainder, 60)
+    return f'{hours}h{minutes:02d}m' if hours else f'{minutes}m{seconds:02d}s'
+
+
+class Reporter:
+    """Logs the progress line and flushes the metrics file every `interval` seconds from a background thread.
+
+    A warning is logged when no project has completed for stall_seconds, and
+    again each time the stall grows by as long again.
+    """
+
+    def __init__(self, metrics, filepath=None, interval=10.0, stall_seconds=600.0):
+        self.metrics = metrics
+        self.filepath = filepath
+        self.interval = interval
+        self.stall_seconds = stall_seconds
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='metrics', daemon=True)
+        self._stall_warned = 0
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        self.report()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.report()
+            self._check_stall()
+
+    def report(self):
+        line = self.metrics.progress_line()
+        if line:
+            logger.info(line)
+        if self.filepath:
+            try:
+                self.metrics.write(self.filepath)
+            except OSError as e:
+                logger.warning('Failed to write metrics to %s: %s', self.filepath, e)
+
+    def _check_stall(self):
+        stalled = self.metrics.stalled_for()
+        if stalled < self.stall_seconds:
+            self._stall_warned = 0
+            return
+        if stalled >= self.stall_seconds * (self._stall_warned + 1):
+            self._stall_warned += 1
+            logger.warning('No project has completed in %s. The run may be stalled', format_duration(stalled))
+
+
+metrics = Metrics()
@@ -0,0 +1,248 @@
+import logging
+from html.parser import HTMLParser
+from urllib.parse import urljoin
+
+from metrics import metrics
+from governor import RequestGovernor
+
+logger = logging.getLogger(__name__)
+
+BASE_URL = 'https://projects.worldbank.org'
+
+# financing tables on the project-detail page, identified by their column headers
+FINANCING_TABLES = [
+    { 'FinancingPlan': ['Financier', 'Commitments']},
+    { 'TotalProjectFinancingTableOne': ['IBRD/IDA', 'Product Line' ]},
+    { 'TotalProjectFinancingTableTwo': ['Investment Project Financing', 'Lending Instrument']},
+    { 'SummaryStatusOfWBFinancing': ['Financier', 'Approval Date', 'Closing Date', 'Principal', 'Disbursed', 'Repayments', 'Interest, Charges & Fees']},
+    { 'DetailedFinancialActivity': ['Period', 'Financier', 'Transaction Type', 'Amount (US$)']}
+]
+
+
+# Reads every table row of the current page in a single WebDriver round trip,
+# returning cells in the same shape as TableParser.
+TABLE_ROWS_SCRIPT = """
+return Array.from(document.querySelectorAll('tr')).map(function (tr) {
+    return Array.from(tr.querySelectorAll('td')).map(function (td) {
+        var link = td.querySelector('a[href]');
+        return {
+            'text': td.innerText.replace(/\\s+/g, ' ').trim(),
+            'data-th': td.getAttribute('data-th') || '',
+            'href': link ? link.href : null
+        };
+    });
+});
+"""
+
+LINKS_SCRIPT = """
+return Array.from(document.querySelectorAll('a[href]')).map(function (a) { return a.href; });
+"""
+
+
+class PageNotRendered(Exception):
+    """Raised when a fetched page has no server-rendered tables to extract from."""
+
+
+class TableParser(HTMLParser):
+    """Collects every table row of a page as a list of cells.
+
+    Each cell is a dict with its whitespace-normalised text, its data-th
+    attribute and the href of the first link inside it, mirroring what the
+    browser path reads through td.text and get_attribute().
+    """
+
+    def __init__(self, base_url=None):
+        super().__init__(convert_charrefs=True)
+        self.base_url = base_url
+        self.rows = []
+        self.links = []
+        self.tables = 0
+        self._row = None
+        self._cell = None
+        self._skip = 0
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag in ('script', 'style'):
+            self._skip += 1
+        elif tag == 'table':
+            self.tables += 1
+        elif tag == 'tr':
+            self._row = []
+            self.rows.append(self._row)
+        elif tag == 'td' and self._row is not None:
+            self._cell = { 'text': [], 'data-th': attrs.get('data-th') or '', 'href': None }
+        elif tag == 'a' and attrs.get('href'):
+            href = urljoin(self.base_url, attrs['href']) if self.base_url else attrs['href']
+            self.links.append(href)
+            if self._cell is not None and self._cell['href'] is None:
+                self._cell['href'] = href
+        elif tag == 'br' and self._cell is not None:
+            self._cell['text'].append('\n')
+
+    def handle_endtag(self, tag):
+        if tag in ('script', 'style'):
+            self._skip = max(self._skip - 1, 0)
+        elif tag == 'td' and self._cell is not None:
+            self._close_cell()
+        elif tag == 'tr':
+            if self._cell is not None:
+                self._close_cell()
+            self._row = None
+
+    def handle_data(self, data):
+        if self._cell is not None and not self._skip:
+            self._cell['text'].append(data)
+
+    def _close_cell(self):
+        self._cell['text'] = ' '.join(''.join(self._cell['text']).split())
+        self._row.append(self._cell)
+        self._cell = None
+
+
+class BrowserReader:
+    """Reads pages through a WebDriver, with one script execution per page.
+
+    Page loads go through the given RequestGovernor, retrying the exception
+    types in retry_on (e.g. selenium's TimeoutException).
+    """
+
+    def __init__(self, driver, governor=None, retry_on=()):
+        self.driver = driver
+        self.governor = governor if governor is not None else RequestGovernor()
+        self.retry_on = retry_on
+        self._calls_at_start = getattr(driver, 'calls', 0)
+
+    @property
+    def calls(self):
+        """WebDriver round trips made since this reader was created."""
+        return getattr(self.driver, 'calls', 0) - self._calls_at_start
+
+    def _read(self, url, script):
+        with metrics.timer('page_load'):
+            self.governor.request(url, lambda: self.driver.get(url), retry_on=self.retry_on, source='browser')
+        with metrics.timer('dom_extraction'):
+            return self.driver.execute_script(script)
+
+    def rows(self, url):
+        return self._read(url, TABLE_ROWS_SCRIPT)
+
+    def links(self, url):
+        return self._read(url, LINKS_SCRIPT)
+
+
+class FallbackReader:
+    """Reads pages with a primary reader, using a fallback reader for pages it cannot render.
+
+    The fallback is created on first use, so e.g. a browser is only started
+    if some page actually needs one.
+    """
+
+    def __init__(self, reader, create_fallback):
+        self.reader = reader
+        self.create_fallback = create_fallback
+        self.fallback = None
+
+    @property
+    def calls(self):
+        return self.fallback.calls if self.fallback else 0
+
+    def _fallback(self, error):
+        logger.info('Page is not server rendered, falling back to browser: %s', error)
+        metrics.count('browser_fallbacks')
+        if self.fallback is None:
+            self.fallback = self.create_fallback()
+        return self.fallback
+
+    def rows(self, url):
+        try:
+            return self.reader.rows(url)
+        except PageNotRendered as e:
+            return self._fallback(e).rows(url)
+
+    def links(self, url):
+        try:
+            return self.reader.links(url)
+        except PageNotRendered as e:
+            return self._fallback(e).links(url)
+
+
+def document_detail_url(project_id, base_url=BASE_URL):
+    return f'{base_url}/en/projects-operations/document-detail/{project_id}'
+
+
+def project_detail_url(project_id, base_url=BASE_URL):
+    return f'{base_url}/en/projects-operations/project-detail/{project_id}'
+
+
+def parse_page(html, base_url=None):
+    parser = TableParser(base_url)
+    parser.feed(html)
+    parser.close()
+    return parser
+
+
+def financing_rows(rows):
+    """Keys each row's cells by their data-th header, dropping the trailing colon."""
+    row_objects = []
+    for row in rows:
+        row_object = {}
+        for cell in row:
+            data_key = cell['data-th']
+            if len(data_key) > 0 and data_key.endswith(':'):
+                row_object[data_key[:len(data_key)-1]] = cell['text']
+        if len(row_object.keys()) > 0:
+            row_objects.append(row_object)
+    return row_objects
+
+
+def build_project_details(row_objects):
+    project_details = { list(table.keys())[0]: [] for table in FINANCING_TABLES }
+
+    # append details accordingly
+    for row in row_objects:
+        for project_detail in FINANCING_TABLES:
+            if sorted(list(row.keys())) == sorted(list(project_detail.values())[0]):
+                project_details[(list(project_detail.keys())[0])].append(row)
+    return project_details
+
+
+def document_page_links(rows, document_types):
+    target_rows = [row for row in rows if any(cell['text'] in document_types for cell in row)]
+    return [row[0]['href'] for row in target_rows if row and row[0]['href']]
+
+
+def build_document_details(rows):
+    return [{
+        'document_name': row[0]['text'],
+        'date': row[1]['text'],
+        'report_number': row[2]['text'],
+        'document_type': row[3]['text'],
+        'document_url': row[0]['href']
+    } for row in rows if len(row) == 4]
+
+
+def document_file_links(links):
+    return [link for link in links if link and (link.endswith('.txt') or link.endswith('.pdf'))]
+
+
+def scrape_document_links(reader, project_id, document_types, rows=None, base_url=BASE_URL):
+    """Returns (document_page_links, document_file_links) for a project's documents of the given types.
+
+    rows may be passed in when the document-detail page has already been read.
+    """
+    if rows is None:
+        rows = reader.rows(document_detail_url(project_id, base_url))
+    page_links = document_page_links(rows, document_types)
+    file_links = []
+    for document_page in page_links:
+        file_links += document_file_links(reader.links(document_page))
+    return page_links, file_links
+
+
+def scrape_metadata(reader, project_id, rows=None, base_url=BASE_URL):
+    """Returns (project_details, document_details), as stored under addtional_details and project_documents."""
+    project_details = build_project_details(financing_rows(reader.rows(project_detail_url(project_id, base_url))))
+    if rows is None:
+        rows = reader.rows(document_detail_url(project_id, base_url))
+    return project_details, build_document_details(rows)
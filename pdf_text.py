@@ -0,0 +1,98 @@
+import os
+import logging
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+from document_store import file_digest
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+TEXT_CACHE_DIRECTORY = '.text'
+# converted text keeps the pdf's characters, e.g. curly quotes, ligatures and accented names
+TEXT_ENCODING = 'utf-8'
+
+
+def pdf_to_text(path):
+    """Returns (text, page count) for a pdf, one page of text per line break."""
+    import pypdf
+    reader = pypdf.PdfReader(path)
+    pages = [page.extract_text() or '' for page in reader.pages]
+    return '\n'.join(pages), len(pages)
+
+
+def pdfs_without_text(names):
+    """Returns the .pdf names in names that have no .txt version alongside them."""
+    text_stems = set(os.path.splitext(name)[0] for name in names if name.endswith('.txt'))
+    return [name for name in names if name.endswith('.pdf') and os.path.splitext(name)[0] not in text_stems]
+
+
+class TextCache:
+    """Converted pdf text, stored by the sha256 of the pdf so a file is never converted twice."""
+
+    def __init__(self, directory=os.path.join('./documents', TEXT_CACHE_DIRECTORY)):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, digest):
+        return os.path.join(self.directory, digest[:2], digest + '.txt')
+
+    def __contains__(self, digest):
+        return os.path.exists(self.path(digest))
+
+    def put(self, digest, text):
+        path = self.path(digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.part')
+        with os.fdopen(fd, 'w', encoding=TEXT_ENCODING, errors='replace') as f:
+            f.write(text)
+        os.replace(temp_path, path)
+        return path
+
+
+def convert_pdf(cache_directory, pdf_path, digest=None):
+    """Converts a pdf into the cache. Returns (pdf path, cached text path, pages converted)."""
+    cache = TextCache(cache_directory)
+    digest = digest or file_digest(pdf_path)
+    if digest in cache:
+        return pdf_path, cache.path(digest), 0
+    text, pages = pdf_to_text(pdf_path)
+    return pdf_path, cache.put(digest, text), pages
+
+
+def _convert_pdf(task):
+    try:
+        return convert_pdf(*task), None
+    except Exception as e:
+        return (task[1], None, 0), e
+
+
+def convert_pdfs(tasks, cache, workers=None):
+    """Converts (pdf path, digest) tasks in a process pool, yielding (pdf path, text path, pages) as they finish.
+
+    Pdfs already in the cache aren't sent to the pool. Pdfs that fail to parse are
+    reported and yielded with a text path of None.
+    """
+    pending = []
+    for pdf_path, digest in tasks:
+        if digest is not None and digest in cache:
+            yield pdf_path, cache.path(digest), 0
+        else:
+            pending.append((cache.directory, pdf_path, digest))
+
+    if workers == 1 or len(pending) <= 1:
+        results = map(_convert_pdf, pending)
+        yield from _report_failures(results)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        yield from _report_failures(executor.map(_convert_pdf, pending))
+
+
+def _report_failures(results):
+    for result, error in results:
+        if error is not None:
+            logger.warning('Failed to convert %s to text: %s', os.path.basename(result[0]), error)
+            metrics.count('pdf_failures')
+        else:
+            metrics.count('pdf_pages_converted', result[2])
+        yield result
@@ -0,0 +1,99 @@
+import time
+import queue
+import threading
+
+_DONE = object()
+
+
+class Stage:
+    """A pipeline step: function is applied to each item by `workers` threads."""
+
+    def __init__(self, name, function, workers=1):
+        self.name = name
+        self.function = function
+        self.workers = max(1, workers)
+        self.busy_seconds = 0.0
+        self.processed = 0
+
+
+class Pipeline:
+    """Runs items through a sequence of stages concurrently over bounded queues.
+
+    Each stage's output is passed on to the next stage and, along with any
+    error, reported back to the thread iterating run(). Stage functions only
+    compute; the caller records results, so it remains the single writer of
+    shared state. Queues between stages hold at most queue_size items, so a
+    fast stage blocks rather than running arbitrarily far ahead of a slow one,
+    and total run time tends towards that of the slowest stage.
+    """
+
+    def __init__(self, stages, queue_size=16):
+        self.stages = stages
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+
+    def _work(self, stage, inbox, outbox, events, remaining, next_workers):
+        while True:
+            item = inbox.get()
+            if item is _DONE:
+                break
+            start = time.monotonic()
+            try:
+                result, error = stage.function(item), None
+            except Exception as e:
+                result, error = None, e
+            with self._lock:
+                stage.busy_seconds += time.monotonic() - start
+                stage.processed += 1
+            events.put((stage.name, item, result, error))
+            if error is None and outbox is not None:
+                outbox.put(result)
+
+        # the last worker out tells the next stage there is nothing more to come
+        with self._lock:
+            remaining[stage.name] -= 1
+            last = remaining[stage.name] == 0
+        if last:
+            if outbox is not None:
+                for _ in range(next_workers):
+                    outbox.put(_DONE)
+            else:
+                events.put(_DONE)
+
+    def run(self, items):
+        """Feeds items through every stage, yielding (stage name, input, result, error) as each step completes."""
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in self.stages]
+        events = queue.Queue()
+        remaining = { stage.name: stage.workers for stage in self.stages }
+        threads = []
+        for index, stage in enumerate(self.stages):
+            last = index == len(self.stages) - 1
+            outbox = None if last else queues[index + 1]
+            next_workers = 0 if last else self.stages[index + 1].workers
+            for worker in range(stage.workers):
+                threads.append(threading.Thread(target=self._work, name=f'{stage.name}-{worker}', daemon=True,
+                    args=(stage, queues[index], outbox, events, remaining, next_workers)))
+
+        def feed():
+            for item in items:
+                queues[0].put(item)
+            for _ in range(self.stages[0].workers):
+                queues[0].put(_DONE)
+
+        threads.append(threading.Thread(target=feed, name='feed', daemon=True))
+        started = time.monotonic()
+        [thread.start() for thread in threads]
+        while True:
+            event = events.get()
+            if event is _DONE:
+                break
+            yield event
+        [thread.join() for thread in threads]
+        self.elapsed = time.monotonic() - started
+
+    def report(self):
+        lines = [f'Pipeline finished in {self.elapsed:.1f}s']
+        for stage in self.stages:
+            lines.append(f'  {stage.name}: {stage.processed} item(s), {stage.busy_seconds:.1f}s busy '
+                         f'across {stage.workers} worker(s)')
+        return '\n'.join(lines)
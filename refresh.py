@@ -0,0 +1,52 @@
+import json
+import hashlib
+
+# projects still being implemented are the ones that gain documents
+ACTIVE_STATUSES = ('Active', 'Pipeline')
+# fields -agg keeps current from the api, rather than only filling in when missing, since refreshes are keyed on them
+API_TRACKED_KEYS = ('lastupdatedate', 'projectstatusdisplay', 'status')
+
+
+def document_keys(rows):
+    """Identifies each document row of a document-detail page by its name, date and report number."""
+    return [[row[0]['text'], row[1]['text'], row[2]['text']] for row in rows if len(row) == 4]
+
+
+def baseline_keys(record):
+    """Document keys from the project_documents saved by metadata extraction, for projects without a fingerprint."""
+    return [
+        [document['document_name'], document['date'], document['report_number']]
+        for document in record.get('project_documents', [])
+    ]
+
+
+def fingerprint(keys):
+    return hashlib.sha1(json.dumps(sorted(keys)).encode()).hexdigest()
+
+
+def new_rows(rows, known_keys):
+    """Returns the document rows whose keys are not in known_keys."""
+    known = set(map(tuple, known_keys))
+    return [row for row in rows if len(row) == 4 and (row[0]['text'], row[1]['text'], row[2]['text']) not in known]
+
+
+def is_active(record):
+    return record.get('projectstatusdisplay', record.get('status')) in ACTIVE_STATUSES
+
+
+def needs_refresh(record, saved):
+    """Closed projects are only re-checked when the api reports an update since their last fingerprint."""
+    if saved is None or is_active(record):
+        return True
+    return record.get('lastupdatedate') != saved['lastupdatedate']
+
+
+def api_fields(record, api_project):
+    """Returns the api fields to merge into a record: those it is missing, plus the current update date and status."""
+    return { key: value for key, value in api_project.items() if key not in record or key in API_TRACKED_KEYS }
+
+
+def prioritize(records):
+    """Orders (project_id, record) pairs with active, then most recently updated, projects first."""
+    by_update = sorted(records, key=lambda item: item[1].get('lastupdatedate') or '', reverse=True)
+    return sorted(by_update, key=lambda item: not is_active(item[1]))
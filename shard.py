@@ -0,0 +1,159 @@
+import os
+import shutil
+import hashlib
+import logging
+from argparse import ArgumentTypeError
+
+from document_store import DocumentStore
+from pdf_text import TextCache
+from state import STAGES, ExtractionState
+from store import ProjectStore
+
+logger = logging.getLogger(__name__)
+
+SHARDS_DIRECTORY = 'shards'
+# the shard's records as they were copied from the canonical store, so merges can tell what the shard changed
+SEED_FILENAME = 'seed.db'
+
+
+def parse_shard(value):
+    """Parses a K/N shard argument into (K, N), where 1 <= K <= N."""
+    try:
+        shard, shards = (int(part) for part in value.split('/'))
+    except ValueError:
+        raise ArgumentTypeError(f'expected a shard as K/N, e.g. 1/4, got {value!r}')
+    if not 1 <= shard <= shards:
+        raise ArgumentTypeError(f'shard {value} is out of range. K must be between 1 and N')
+    return shard, shards
+
+
+def shard_of(project_id, shards):
+    """Returns the shard, 1 to shards, a project belongs to.
+
+    Hashes the project id rather than its position in a list, so every machine
+    agrees on the partition whichever projects it has records for.
+    """
+    return int(hashlib.sha1(project_id.encode()).hexdigest()[:8], 16) % shards + 1
+
+
+def shard_directory(shard, shards, root=SHARDS_DIRECTORY):
+    return os.path.join(root, f'{shard}-of-{shards}')
+
+
+def parse_shard_directory(directory):
+    """Returns (K, N) from a directory named by shard_directory()."""
+    try:
+        shard, shards = (int(part) for part in os.path.basename(os.path.normpath(directory)).split('-of-'))
+    except ValueError:
+        raise ValueError(f'{directory} is not a shard directory. Expected a name like 1-of-4')
+    return shard, shards
+
+
+def shard_directories(root=SHARDS_DIRECTORY):
+    if not os.path.isdir(root):
+        return []
+    return sorted(entry.path for entry in os.scandir(root) if entry.is_dir() and '-of-' in entry.name)
+
+
+def seed_shard(shard, shards, projects, extraction_details, canonical_projects, canonical_details):
+    """Copies the shard's projects that it doesn't have yet from the canonical stores.
+
+    Records go into the shard's projects.db and its seed.db, along with their
+    refresh fingerprints and the stages already extracted for them. Returns
+    the number of projects added, so new projects in the canonical store are
+    picked up by the shard's next run.
+    """
+    with ProjectStore(os.path.join(os.path.dirname(projects.filepath), SEED_FILENAME), batch_size=1000) as seed:
+        seeded = set(seed.keys())
+        added = {}
+        for project_id, record in canonical_projects.items():
+            if project_id not in seeded and shard_of(project_id, shards) == shard:
+                projects.put(project_id, record)
+                seed.put(project_id, record)
+                added[project_id] = None
+        projects.commit()
+
+    for project_id, saved in canonical_projects.fingerprints():
+        if project_id in added:
+            projects.put_fingerprint(project_id, saved['fingerprint'], saved['document_keys'], saved['lastupdatedate'])
+    for stage in STAGES:
+        extraction_details.add_many(stage, [project_id for project_id in canonical_details[stage] if project_id in added])
+    return len(added)
+
+
+def merge_records(shard_projects, seed, projects, owns):
+    """Applies the fields each shard project changed since it was seeded. Returns (projects updated, conflicts).
+
+    A field the canonical store also changed since the seed, to something
+    else, is a conflict. The shard's value wins, since the shard is the one
+    that extracted the project.
+    """
+    updated = conflicts = 0
+    for project_id, record in shard_projects.items():
+        if not owns(project_id):
+            continue
+        base = seed.get(project_id) or {}
+        current = projects.get(project_id) or {}
+        # fields the shard changed that aren't in the canonical record yet, so merging twice changes nothing
+        changes = { key: value for key, value in record.items()
+            if (key not in base or base[key] != value) and (key not in current or current[key] != value) }
+        if not changes:
+            continue
+        conflicts += sum(1 for key, value in changes.items()
+            if key in current and current[key] != base.get(key) and current[key] != value)
+        projects.update(project_id, changes)
+        updated += 1
+    projects.commit()
+
+    for project_id, saved in shard_projects.fingerprints():
+        if owns(project_id) and projects.get_fingerprint(project_id) != saved:
+            projects.put_fingerprint(project_id, saved['fingerprint'], saved['document_keys'], saved['lastupdatedate'])
+    return updated, conflicts
+
+
+def merge_text_cache(shard_cache, text_cache):
+    """Adds converted text the canonical cache doesn't have yet. Returns the number of files added."""
+    added = 0
+    for root, _, filenames in os.walk(shard_cache.directory):
+        for filename in filenames:
+            digest, extension = os.path.splitext(filename)
+            if extension != '.txt' or digest in text_cache:
+                continue
+            target = text_cache.path(digest)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            try:
+                os.link(os.path.join(root, filename), target)
+            except OSError:
+                shutil.copyfile(os.path.join(root, filename), target)
+            added += 1
+    return added
+
+
+def merge_shard(directory, projects, extraction_details, document_store, text_cache):
+    """Merges one shard's records, extraction details and documents into the canonical stores.
+
+    Only projects in the shard's partition are merged, so a shard can't
+    overwrite another's projects. Merging is idempotent: merging the same
+    shard again adds nothing. Returns a dict of what was merged.
+    """
+    shard, shards = parse_shard_directory(directory)
+    owns = lambda project_id: shard_of(project_id, shards) == shard
+    with ProjectStore(os.path.join(directory, 'projects.db')) as shard_projects, \
+            ProjectStore(os.path.join(directory, SEED_FILENAME)) as seed:
+        updated, conflicts = merge_records(shard_projects, seed, projects, owns)
+
+    shard_details = ExtractionState(os.path.join(directory, 'extraction_details.json'))
+    extracted = sum(extraction_details.add_many(stage, [project_id for project_id in shard_details[stage] if owns(project_id)])
+        for stage in STAGES)
+
+    documents = 0
+    shard_documents = DocumentStore(os.path.join(directory, 'documents'))
+    try:
+        for project_id in shard_documents.project_ids():
+            if owns(project_id):
+                documents += sum(document_store.add_from(shard_documents, name) for name in shard_documents.names(project_id))
+        texts = merge_text_cache(TextCache(os.path.join(shard_documents.directory, '.text')), text_cache)
+    finally:
+        shard_documents.close()
+
+    return { 'projects': updated, 'conflicts': conflicts, 'extracted': extracted, 'documents': documents, 'texts': texts }
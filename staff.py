@@ -0,0 +1,87 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from metrics import metrics
+
+STAFF_SEARCH_TERMS = ['Vice President:', 'Country Director:', 'Sector Manager:', 'Task Team Leader:', 'Name:']
+# downloaded text documents are read as latin1, which decodes any bytes. converted pdf text has its own encoding
+DOCUMENT_ENCODING = 'latin1'
+
+
+def add_staff_line(line, staff_information):
+    line_data = ' '.join(line.split()).split(':')
+    if len(line_data) == 2: # filters out keys with missing values
+        key, value = line_data
+        staff_information[key] = value
+
+
+def staff_line_starts(text):
+    """Returns the sorted start offsets of every line in text containing a search term."""
+    starts = set()
+    for term in STAFF_SEARCH_TERMS:
+        position = text.find(term)
+        while position != -1:
+            starts.add(text.rfind('\n', 0, position) + 1)
+            position = text.find(term, position + len(term))
+    return sorted(starts)
+
+
+def extract_from_file(path, staff_information, encoding=DOCUMENT_ENCODING, block_size=1024 * 1024):
+    """Streams a text document in blocks, adding any 'Key: Value' staff lines to staff_information.
+
+    Blocks are cut at their last newline and scanned with str.find, one C-level
+    pass per search term, which is several times faster than looping over lines
+    (or a regex alternation) in Python. Only matching lines are split out.
+    """
+    with open(path, 'r', encoding=encoding, errors='replace') as f:
+        remainder = ''
+        while True:
+            block = f.read(block_size)
+            text = remainder + block
+            if block:
+                cut = text.rfind('\n') + 1
+                text, remainder = text[:cut], text[cut:]
+
+            for start in staff_line_starts(text):
+                end = text.find('\n', start)
+                add_staff_line(text[start:end if end != -1 else len(text)], staff_information)
+
+            if not block:
+                break
+    return staff_information
+
+
+def extract_project(project_id, documents):
+    """Extracts a project's staff information from its (path, encoding) text documents."""
+    staff_information = {}
+    for path, encoding in documents:
+        extract_from_file(path, staff_information, encoding)
+    return project_id, staff_information
+
+
+def timed_extract_project(project_id, documents):
+    """extract_project, also returning the seconds it took, for callers recording parse timings across processes."""
+    start = time.perf_counter()
+    return (*extract_project(project_id, documents), time.perf_counter() - start)
+
+
+def _extract_project(task):
+    return timed_extract_project(*task)
+
+
+def extract_projects(tasks, workers=None):
+    """Runs extract_project over (project_id, documents) tasks in a process pool, yielding results as they complete."""
+    tasks = list(tasks)
+    if workers == 1 or len(tasks) <= 1:
+        yield from _record_timings(map(_extract_project, tasks))
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        yield from _record_timings(
+            executor.map(_extract_project, tasks, chunksize=max(1, len(tasks) // ((workers or os.cpu_count()) * 4))))
+
+
+def _record_timings(results):
+    for project_id, staff_information, seconds in results:
+        metrics.observe('parse', seconds)
+        yield project_id, staff_information
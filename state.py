@@ -0,0 +1,137 @@
+import os
+import json
+
+from journal import end_last_line, read_entries
+from metrics import metrics
+
+STAGES = ('documents', 'metadata', 'staff_information')
+
+
+class ExtractionState:
+    """Tracks which projects have been extracted for each stage.
+
+    Membership is held in insertion-ordered dicts, so skip checks are O(1).
+    Changes are appended to a JSONL journal next to the snapshot file instead
+    of rewriting it, and the journal is folded back into the snapshot every
+    compact_every entries (and on close). The snapshot keeps the original
+    extraction_details.json layout, so existing files are picked up as-is and
+    external readers of the file keep working.
+
+    Nothing is read until the state is first used. Each snapshot is written
+    with a small .counts file alongside it, so counts() can report progress
+    without parsing the snapshot.
+    """
+
+    def __init__(self, filepath='extraction_details.json', compact_every=1000):
+        self.filepath = filepath
+        self.journal_path = filepath + '.journal'
+        self.counts_path = filepath + '.counts'
+        self.compact_every = compact_every
+        self._stages = { stage: {} for stage in STAGES }
+        self._journal = None
+        self._journal_entries = 0
+        self._loaded = False
+
+    def _load(self):
+        if self._loaded:
+            return
+        self._loaded = True
+        if os.path.exists(self.filepath):
+            with open(self.filepath, 'r') as f:
+                snapshot = json.loads(f.read() or '{}')
+            for stage in STAGES:
+                self._stages[stage] = dict.fromkeys(snapshot.get(stage, []))
+
+        if os.path.exists(self.journal_path):
+            for entry in read_entries(self.journal_path):
+                self._apply(entry)
+                self._journal_entries += 1
+            # so new entries aren't appended onto a line torn by an interrupted run
+            end_last_line(self.journal_path)
+
+    def _apply(self, entry):
+        if 'reset' in entry:
+            self._stages[entry['reset']] = {}
+        else:
+            self._stages[entry['stage']].update(dict.fromkeys(entry['project_ids']))
+
+    def _write(self, entry):
+        self._load()
+        self._apply(entry)
+        with metrics.timer('persist'):
+            if self._journal is None:
+                self._journal = open(self.journal_path, 'a')
+            self._journal.write(json.dumps(entry) + '\n')
+            self._journal.flush()
+        self._journal_entries += 1
+        if self._journal_entries >= self.compact_every:
+            self.compact()
+
+    def __getitem__(self, stage):
+        """Returns a read-only, set-like view of the project ids extracted for stage."""
+        self._load()
+        return self._stages[stage].keys()
+
+    def add(self, stage, project_id):
+        self.add_many(stage, [project_id])
+
+    def add_many(self, stage, project_ids):
+        self._load()
+        new_ids = [project_id for project_id in dict.fromkeys(project_ids) if project_id not in self._stages[stage]]
+        if new_ids:
+            self._write({ 'stage': stage, 'project_ids': new_ids })
+        return len(new_ids)
+
+    def reset(self, stage):
+        self._write({ 'reset': stage })
+
+    def counts(self):
+        """Returns the number of projects extracted for each stage.
+
+        While the .counts file matches the snapshot and there is no journal to
+        replay, it is read instead of the snapshot.
+        """
+        if not self._loaded and not os.path.exists(self.journal_path):
+            try:
+                with open(self.counts_path, 'r') as f:
+                    counts = json.loads(f.read())
+                if counts.pop('snapshot') == self._snapshot_version():
+                    return counts
+            except (OSError, ValueError, KeyError):
+                pass
+        self._load()
+        if not os.path.exists(self.journal_path) and os.path.exists(self.filepath):
+            self._write_counts()
+        return { stage: len(ids) for stage, ids in self._stages.items() }
+
+    def _snapshot_version(self):
+        # the snapshot's size and modification time, which change whenever anything rewrites it
+        stat = os.stat(self.filepath)
+        return [stat.st_size, stat.st_mtime_ns]
+
+    def _write_counts(self):
+        counts = { stage: len(ids) for stage, ids in self._stages.items() }
+        temp_path = self.counts_path + '.tmp'
+        with open(temp_path, 'w') as f:
+            f.write(json.dumps({ **counts, 'snapshot': self._snapshot_version() }))
+        os.replace(temp_path, self.counts_path)
+
+    def compact(self):
+        """Folds the journal into the snapshot file, atomically replacing it."""
+        self._load()
+        temp_path = self.filepath + '.tmp'
+        with open(temp_path, 'w') as f:
+            f.write(json.dumps({ stage: list(ids) for stage, ids in self._stages.items() }))
+        os.replace(temp_path, self.filepath)
+        self._write_counts()
+
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+        self._journal_entries = 0
+
+    def close(self):
+        if self._journal_entries or not os.path.exists(self.filepath):
+            self.compact()
@@ -0,0 +1,147 @@
+import os
+import json
+import sqlite3
+
+from metrics import metrics
+
+
+class ProjectStore:
+    """Per-project record store backed by SQLite.
+
+    Replaces rewriting the whole of aggregated.json after every project:
+    records are stored one row per project, so reading or updating a project
+    never parses the others. Writes are buffered and committed in batches in
+    a single transaction, which SQLite applies atomically. Callbacks passed
+    as on_commit run once the write they accompany is durable, so callers can
+    mark a project as extracted only after its data has landed.
+    """
+
+    def __init__(self, filepath='projects.db', batch_size=100):
+        self.filepath = filepath
+        self.batch_size = batch_size
+        self._connection = sqlite3.connect(filepath)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+        self._connection.execute('CREATE TABLE IF NOT EXISTS projects (project_id TEXT PRIMARY KEY, record TEXT NOT NULL)')
+        self._connection.execute('CREATE TABLE IF NOT EXISTS fingerprints (project_id TEXT PRIMARY KEY, '
+            'fingerprint TEXT NOT NULL, document_keys TEXT NOT NULL, lastupdatedate TEXT)')
+        self._pending = {}
+        self._on_commit = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        self.commit()
+        return self._connection.execute('SELECT COUNT(*) FROM projects').fetchone()[0]
+
+    def __contains__(self, project_id):
+        return self.get(project_id) is not None
+
+    def __getitem__(self, project_id):
+        record = self.get(project_id)
+        if record is None:
+            raise KeyError(project_id)
+        return record
+
+    def keys(self):
+        self.commit()
+        return [row[0] for row in self._connection.execute('SELECT project_id FROM projects ORDER BY rowid')]
+
+    def items(self):
+        """Yields (project_id, record) pairs one at a time, in insertion order."""
+        self.commit()
+        for project_id, record in self._connection.execute('SELECT project_id, record FROM projects ORDER BY rowid'):
+            yield project_id, json.loads(record)
+
+    def get(self, project_id, default=None):
+        if project_id in self._pending:
+            return self._pending[project_id]
+        row = self._connection.execute('SELECT record FROM projects WHERE project_id = ?', (project_id,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def put(self, project_id, record, on_commit=None):
+        self._pending[project_id] = record
+        if on_commit:
+            self._on_commit.append(on_commit)
+        if len(self._pending) >= self.batch_size:
+            self.commit()
+
+    def update(self, project_id, fields, on_commit=None):
+        """Merges fields into a project's record, creating the record if needed."""
+        record = self.get(project_id) or {}
+        record.update(fields)
+        self.put(project_id, record, on_commit)
+
+    def put_many(self, items):
+        count = 0
+        for project_id, record in items:
+            self.put(project_id, record)
+            count += 1
+        self.commit()
+        return count
+
+    def commit(self):
+        if self._pending:
+            with metrics.timer('persist'), self._connection:
+                self._connection.executemany(
+                    'INSERT INTO projects (project_id, record) VALUES (?, ?) '
+                    'ON CONFLICT(project_id) DO UPDATE SET record = excluded.record',
+                    [(project_id, json.dumps(record)) for project_id, record in self._pending.items()]
+                )
+            self._pending = {}
+        callbacks, self._on_commit = self._on_commit, []
+        for callback in callbacks:
+            callback()
+
+    def get_fingerprint(self, project_id):
+        """Returns the document table fingerprint saved by the last refresh of a project, or None."""
+        row = self._connection.execute(
+            'SELECT fingerprint, document_keys, lastupdatedate FROM fingerprints WHERE project_id = ?', (project_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return { 'fingerprint': row[0], 'document_keys': json.loads(row[1]), 'lastupdatedate': row[2] }
+
+    def fingerprints(self):
+        """Yields (project_id, fingerprint) for every project refreshed so far, as returned by get_fingerprint."""
+        for project_id, fingerprint, document_keys, lastupdatedate in self._connection.execute(
+                'SELECT project_id, fingerprint, document_keys, lastupdatedate FROM fingerprints ORDER BY rowid'):
+            yield project_id, { 'fingerprint': fingerprint, 'document_keys': json.loads(document_keys),
+                'lastupdatedate': lastupdatedate }
+
+    def put_fingerprint(self, project_id, fingerprint, document_keys, lastupdatedate):
+        with self._connection:
+            self._connection.execute(
+                'INSERT INTO fingerprints (project_id, fingerprint, document_keys, lastupdatedate) VALUES (?, ?, ?, ?) '
+                'ON CONFLICT(project_id) DO UPDATE SET fingerprint = excluded.fingerprint, '
+                'document_keys = excluded.document_keys, lastupdatedate = excluded.lastupdatedate',
+                (project_id, fingerprint, json.dumps(document_keys), lastupdatedate)
+            )
+
+    def import_json(self, filepath='aggregated.json'):
+        """Loads a legacy aggregated.json file into the store."""
+        with open(filepath, 'r') as f:
+            projects = json.loads(f.read())
+        self.put_many(projects.items())
+        return len(projects)
+
+    def export_json(self, filepath='aggregated.json'):
+        """Writes every record to a legacy aggregated.json file, one project at a time."""
+        temp_path = filepath + '.tmp'
+        count = 0
+        with open(temp_path, 'w') as f:
+            f.write('{')
+            for project_id, record in self.items():
+                f.write(('' if count == 0 else ', ') + json.dumps(project_id) + ': ' + json.dumps(record))
+                count += 1
+            f.write('}')
+        os.replace(temp_path, filepath)
+        return count
+
+    def close(self):
+        self.commit()
+        self._connection.close()
@@ -0,0 +1,83 @@
+import json
+
+import pytest
+
+from api import ApiError, ProjectsApi, ResponseCache
+from benchmarks.replay import ReplayServer, save_fixture
+from governor import RequestGovernor
+
+PROJECTS = 45
+PAGE_SIZE = 10
+
+
+def api_url(base_url):
+    return f'{base_url}/api/v2/projects'
+
+
+def projects_api(base_url, cache=None, retries=4):
+    # backoff is capped well below Retry-After, so retried requests don't slow the tests down
+    governor = RequestGovernor(rate=0, retries=retries, backoff=0.01, max_backoff=0.05)
+    return ProjectsApi(api_url(base_url), page_size=PAGE_SIZE, workers=2, cache=cache, governor=governor)
+
+
+@pytest.fixture
+def site(tmp_path):
+    """An api of PROJECTS projects. Fixtures are keyed by path and query only, so any base url finds them."""
+    directory = tmp_path / 'site'
+    project_ids = [f'P{project:06d}' for project in range(PROJECTS)]
+    api = projects_api('http://replay')
+    for offset in range(0, PROJECTS, PAGE_SIZE):
+        rows = min(PAGE_SIZE, PROJECTS - offset)
+        page = { 'total': PROJECTS, 'projects': { project_id: { 'id': project_id, 'project_name': f'Project {project_id}' }
+            for project_id in project_ids[offset:offset + rows] } }
+        save_fixture(str(directory), api.page_url(offset, rows), json.dumps(page).encode())
+    return str(directory), project_ids
+
+
+def fetch_all(api):
+    projects = {}
+    for page in api.pages(PROJECTS):
+        projects.update(page)
+    return projects
+
+
+def test_pages_every_project(site):
+    directory, project_ids = site
+    with ReplayServer(directory) as server:
+        api = projects_api(server.url)
+        projects = fetch_all(api)
+    assert sorted(projects) == project_ids
+    assert api.fetched == 5 and api.not_modified == 0
+
+
+def test_failed_requests_are_retried(site):
+    directory, project_ids = site
+    with ReplayServer(directory, error_rate=0.3) as server:
+        api = projects_api(server.url)
+        projects = fetch_all(api)
+        errors = server.errors
+    assert errors > 0
+    assert sorted(projects) == project_ids
+    assert api.fetched == 5
+
+
+def test_gives_up_once_retries_run_out(site):
+    directory, _ = site
+    with ReplayServer(directory, error_rate=1.0) as server:
+        with pytest.raises(ApiError):
+            fetch_all(projects_api(server.url, retries=1))
+
+
+def test_second_run_is_served_from_the_cache(site, tmp_path):
+    directory, project_ids = site
+    cache = ResponseCache(str(tmp_path / 'cache'))
+    with ReplayServer(directory) as server:
+        first = projects_api(server.url, cache)
+        assert sorted(fetch_all(first)) == project_ids
+
+        second = projects_api(server.url, cache)
+        projects = fetch_all(second)
+        not_modified = server.not_modified
+    assert sorted(projects) == project_ids
+    assert (second.fetched, second.not_modified) == (0, 5)
+    assert not_modified == 5
@@ -0,0 +1,34 @@
+import io
+import json
+
+import pytest
+
+import worldbank_projects
+from worldbank_projects import _iter_json_array
+
+
+def elements(text, chunk_size=None, monkeypatch=None):
+    if chunk_size:
+        monkeypatch.setattr(worldbank_projects, '_CHUNK_SIZE', chunk_size)
+    return list(_iter_json_array(io.StringIO(text)))
+
+
+def test_only_the_top_level_key_is_read():
+    assert elements('{"other": [{"data": [9]}], "note": "\\"data\\": [8]", "data": [1, 2]}') == [1, 2]
+
+
+def test_missing_key_yields_nothing():
+    assert elements('{"other": {"data": [9]}}') == []
+    assert elements('[{"data": [9]}]') == []
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 5, 7, 64])
+def test_values_split_across_chunks_are_read_whole(chunk_size, monkeypatch):
+    data = [12345678901234, -1.5e-10, 'a "quoted", [string]', { 'nested': [1, { 'data': [2] }] }, None, True, []]
+    text = json.dumps({ 'meta': { 'rows': 7 }, 'data': data, 'after': 1 }, indent=1)
+    assert elements(text, chunk_size, monkeypatch) == data
+
+
+def test_truncated_file_raises(monkeypatch):
+    with pytest.raises(ValueError):
+        elements('{"data": [1, {"a": ', 4, monkeypatch)
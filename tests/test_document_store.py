@@ -0,0 +1,121 @@
+import os
+import json
+
+import pytest
+
+from document_store import MANIFEST, DocumentStore, file_digest
+
+URL = 'http://replay/files/report.txt'
+
+
+@pytest.fixture
+def directory(tmp_path):
+    return str(tmp_path / 'documents')
+
+
+def write(directory, name, content):
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, name)
+    with open(path, 'w') as f:
+        f.write(content)
+    return path
+
+
+def manifest_lines(directory):
+    with open(os.path.join(directory, MANIFEST)) as f:
+        return f.read().splitlines()
+
+
+def test_existing_documents_are_migrated_in_place(directory):
+    write(directory, 'P000001_report.txt', 'report')
+    write(directory, 'P000002_report.txt', 'report')
+    write(directory, 'P000002_annex.pdf', 'annex')
+    write(directory, 'P000003_download.txt.part', 'partial')
+
+    store = DocumentStore(directory)
+    store.close()
+    assert len(store) == 3
+    assert store.project_ids() == ['P000001', 'P000002']
+    # the duplicate is linked to the first copy's blob rather than stored twice
+    blob = store.blob('P000001_report.txt')
+    assert store.blob('P000002_report.txt') == blob
+    assert os.path.samefile(os.path.join(directory, 'P000002_report.txt'), blob)
+    assert len(os.listdir(os.path.join(directory, '.blobs', file_digest(blob)[:2]))) == 1
+    assert 'P000003_download.txt.part' not in store
+
+
+def test_added_files_are_deduplicated_across_projects(directory, tmp_path):
+    store = DocumentStore(directory)
+    first = store.add_file(write(str(tmp_path / 'downloads'), 'one', 'same content'), 'P000001_report.txt', URL)
+    second = store.add_file(write(str(tmp_path / 'downloads'), 'two', 'same content'), 'P000002_report.txt')
+    store.close()
+    assert os.path.samefile(first, second)
+    assert not os.path.exists(str(tmp_path / 'downloads' / 'two'))
+    assert store.names('P000002') == ['P000002_report.txt']
+    assert sum(len(files) for _, _, files in os.walk(os.path.join(directory, '.blobs'))) == 1
+
+
+def test_link_url_reuses_a_downloaded_file(directory, tmp_path):
+    store = DocumentStore(directory)
+    assert store.link_url(URL, 'P000002_report.txt') is None
+    store.add_file(write(str(tmp_path / 'downloads'), 'one', 'report'), 'P000001_report.txt', URL)
+    path = store.link_url(URL, 'P000002_report.txt')
+    store.close()
+    assert os.path.samefile(path, os.path.join(directory, 'P000001_report.txt'))
+
+    reopened = DocumentStore(directory)
+    reopened.close()
+    assert reopened.entry('P000002_report.txt')['url'] == URL
+
+
+def test_torn_manifest_line_is_repaired(directory, tmp_path):
+    store = DocumentStore(directory)
+    store.add_file(write(str(tmp_path / 'downloads'), 'one', 'one'), 'P000001_one.txt', URL)
+    store.close()
+    # a run killed halfway through writing an entry
+    with open(os.path.join(directory, MANIFEST), 'a') as f:
+        f.write('{"name": "P000002_two.txt", "dig')
+
+    store = DocumentStore(directory)
+    store.add_file(write(str(tmp_path / 'downloads'), 'two', 'two'), 'P000003_three.txt', URL + '?3')
+    store.close()
+    assert all(json.loads(line) for line in manifest_lines(directory))
+
+    reopened = DocumentStore(directory)
+    reopened.close()
+    assert sorted(reopened.project_ids()) == ['P000001', 'P000003']
+    assert reopened.entry('P000003_three.txt')['url'] == URL + '?3'
+    assert len(manifest_lines(directory)) == 2
+
+
+def test_whole_final_entry_without_newline_is_kept(directory, tmp_path):
+    store = DocumentStore(directory)
+    store.add_file(write(str(tmp_path / 'downloads'), 'one', 'one'), 'P000001_one.txt', URL)
+    store.close()
+    manifest = os.path.join(directory, MANIFEST)
+    with open(manifest, 'rb+') as f:
+        f.truncate(os.path.getsize(manifest) - 1)
+
+    store = DocumentStore(directory)
+    store.add_file(write(str(tmp_path / 'downloads'), 'two', 'two'), 'P000002_two.txt')
+    store.close()
+    assert [json.loads(line)['name'] for line in manifest_lines(directory)] == ['P000001_one.txt', 'P000002_two.txt']
+
+
+def test_interrupted_migration_is_resumed(directory):
+    for project in range(5):
+        write(directory, f'P00000{project}_report.txt', str(project))
+    store = DocumentStore(directory)
+    store.close()
+    # as if the run had stopped after recording the first document, with every blob already written
+    first = manifest_lines(directory)[0]
+    with open(os.path.join(directory, MANIFEST), 'w') as f:
+        f.write(first + '\n')
+
+    store = DocumentStore(directory)
+    store.close()
+    assert len(store) == 5
+
+    reopened = DocumentStore(directory)
+    reopened.close()
+    assert len(manifest_lines(directory)) == 5
@@ -0,0 +1,78 @@
+import os
+
+import pytest
+import requests
+
+from benchmarks.replay import ReplayServer, save_fixture
+from downloader import DocumentDownloader
+from governor import RequestGovernor
+
+BODY = bytes(range(256)) * 40
+
+
+@pytest.fixture
+def site(tmp_path):
+    directory = str(tmp_path / 'site')
+    for name in ('one', 'two', 'three'):
+        save_fixture(directory, f'/files/{name}.txt', BODY)
+    return directory
+
+
+def downloader(directory, **options):
+    # no retries, so failed downloads fail straight away
+    governor = RequestGovernor(rate=0, retries=0, backoff=0.01, max_backoff=0.05)
+    return DocumentDownloader(directory=directory, governor=governor, **options)
+
+
+def files(directory):
+    return sorted(os.listdir(directory))
+
+
+def test_file_is_streamed_in_chunks_to_its_final_name(site, tmp_path):
+    documents = str(tmp_path / 'documents')
+    with ReplayServer(site) as server:
+        with downloader(documents, chunk_size=100) as files_downloader:
+            path = files_downloader.submit(f'{server.url}/files/one.txt', 'P000001_one.txt').result()
+    assert path == os.path.join(documents, 'P000001_one.txt')
+    with open(path, 'rb') as f:
+        assert f.read() == BODY
+    assert files(documents) == ['P000001_one.txt']
+
+
+@pytest.mark.parametrize('error_rate,url', [(0.0, '/files/missing.txt'), (1.0, '/files/one.txt')])
+def test_failed_download_leaves_no_partial_file(site, tmp_path, error_rate, url):
+    documents = str(tmp_path / 'documents')
+    with ReplayServer(site, error_rate=error_rate) as server:
+        with downloader(documents) as files_downloader:
+            future = files_downloader.submit(server.url + url, 'P000001_one.txt')
+            with pytest.raises(requests.HTTPError):
+                future.result()
+    assert files(documents) == []
+    assert files_downloader.stats()['failed'] == 1
+
+
+def test_stats_count_bytes_and_queued_downloads(site, tmp_path):
+    documents = str(tmp_path / 'documents')
+    with ReplayServer(site, latency=0.2) as server:
+        with downloader(documents, workers=1) as files_downloader:
+            futures = [files_downloader.submit(f'{server.url}/files/{name}.txt', f'P000001_{name}.txt')
+                for name in ('one', 'two', 'three')]
+            # the single worker is still waiting on the first response
+            assert files_downloader.stats()['queue_depth'] >= 2
+            for future in futures:
+                future.result()
+    stats = files_downloader.stats()
+    assert (stats['completed'], stats['queue_depth'], stats['active']) == (3, 0, 0)
+    assert stats['bytes'] == 3 * len(BODY)
+
+
+def test_existing_file_is_not_downloaded_again(site, tmp_path):
+    documents = str(tmp_path / 'documents')
+    with ReplayServer(site) as server:
+        url = f'{server.url}/files/one.txt'
+        with downloader(documents) as files_downloader:
+            files_downloader.submit(url, 'P000001_one.txt').result()
+            files_downloader.submit(url, 'P000001_one.txt').result()
+        requests_made = server.requests
+    assert requests_made == 1
+    assert files_downloader.stats()['completed'] == 1
@@ -0,0 +1,187 @@
+import time
+from email.utils import formatdate
+
+import pytest
+import requests
+
+from governor import HostLimiter, RequestGovernor, _retry_after
+
+
+class FakeResponse:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def sender(*outcomes):
+    """Returns a send() giving each outcome in turn, raising those that are exceptions, and the calls made."""
+    calls = []
+
+    def send():
+        outcome = outcomes[len(calls)]
+        calls.append(outcome)
+        if isinstance(outcome, BaseException):
+            raise outcome
+        return outcome
+    return send, calls
+
+
+def governor(**options):
+    return RequestGovernor(**{ 'rate': 0, 'backoff': 0.001, 'max_backoff': 0.01, **options })
+
+
+def test_token_bucket_caps_the_rate():
+    limiter = HostLimiter('replay', rate=20, burst=2, max_concurrency=8)
+    start = time.monotonic()
+    for _ in range(6):
+        limiter.release(limiter.acquire(), True, 0.0)
+    # the burst goes straight through, then a token every 1/20s
+    assert time.monotonic() - start >= 0.15
+
+
+def test_concurrency_grows_on_success_and_halves_once_on_failures():
+    limiter = HostLimiter('replay', rate=0, max_concurrency=8)
+    assert limiter.limit == 4
+    for _ in range(100):
+        limiter.release(limiter.acquire(), True, 0.0)
+    assert limiter.limit == 8
+
+    for _ in range(3):
+        limiter.release(limiter.acquire(), False, 0.0)
+    assert limiter.limit == 4
+
+
+def test_slow_responses_reduce_concurrency():
+    limiter = HostLimiter('replay', rate=0, max_concurrency=8, latency_target=1.0)
+    limiter.release(limiter.acquire(), True, 5.0)
+    assert limiter.limit == 2
+
+
+def test_in_flight_requests_are_capped_by_the_limit():
+    limiter = HostLimiter('replay', rate=0, max_concurrency=2, min_concurrency=1)
+    limiter.acquire()
+    assert limiter._wait_time(time.monotonic()) is None
+
+
+def test_circuit_opens_then_closes_after_a_successful_probe():
+    limiter = HostLimiter('replay', rate=0, max_concurrency=8, failure_threshold=3, cooldown=0.1)
+    for _ in range(3):
+        limiter.release(limiter.acquire(), False, 0.0)
+    assert limiter.state == 'open'
+
+    start = time.monotonic()
+    probe = limiter.acquire()
+    assert probe and time.monotonic() - start >= 0.09
+    assert limiter.state == 'half_open'
+    limiter.release(probe, True, 0.0)
+    assert limiter.state == 'closed'
+    assert limiter.limit == limiter.min_concurrency
+
+
+def test_failed_probe_doubles_the_cooldown():
+    limiter = HostLimiter('replay', rate=0, max_concurrency=8, failure_threshold=1, cooldown=0.05)
+    limiter.release(limiter.acquire(), False, 0.0)
+    probe = limiter.acquire()
+    limiter.release(probe, False, 0.0)
+    assert limiter.state == 'open'
+    assert limiter.cooldown == 0.1
+
+
+def test_retry_after_pauses_the_host():
+    limiter = HostLimiter('replay', rate=0, max_concurrency=8)
+    limiter.release(limiter.acquire(), False, 0.0, retry_after=0.2)
+    start = time.monotonic()
+    limiter.release(limiter.acquire(), True, 0.0)
+    assert time.monotonic() - start >= 0.15
+
+
+def test_retryable_statuses_are_retried():
+    send, calls = sender(FakeResponse(503), FakeResponse(429), FakeResponse(200))
+    response = governor().request('http://replay/page', send)
+    assert response.status_code == 200
+    assert len(calls) == 3
+    assert calls[0].closed and calls[1].closed
+
+
+def test_last_response_is_returned_once_retries_run_out():
+    send, calls = sender(FakeResponse(503), FakeResponse(503))
+    assert governor(retries=1).request('http://replay/page', send).status_code == 503
+    assert len(calls) == 2
+
+
+def test_transient_errors_are_retried_and_others_raised():
+    send, calls = sender(requests.ConnectionError(), requests.Timeout(), FakeResponse(200))
+    assert governor().request('http://replay/page', send).status_code == 200
+    assert len(calls) == 3
+
+    send, calls = sender(ValueError('not retryable'))
+    with pytest.raises(ValueError):
+        governor().request('http://replay/page', send)
+    assert len(calls) == 1
+
+    send, calls = sender(requests.ConnectionError(), requests.ConnectionError())
+    with pytest.raises(requests.ConnectionError):
+        governor(retries=1).request('http://replay/page', send)
+
+
+def test_http_errors_with_retryable_statuses_are_retried():
+    send, calls = sender(requests.HTTPError(response=FakeResponse(502)), FakeResponse(200))
+    assert governor().request('http://replay/page', send).status_code == 200
+    assert len(calls) == 2
+
+
+def test_retry_after_sets_the_backoff():
+    send, _ = sender(FakeResponse(429, { 'Retry-After': '0.2' }), FakeResponse(200))
+    start = time.monotonic()
+    governor(max_backoff=1.0).request('http://replay/page', send)
+    assert time.monotonic() - start >= 0.2
+
+
+def test_retry_after_parses_seconds_and_dates():
+    assert _retry_after(FakeResponse(429, { 'Retry-After': '5' })) == 5.0
+    assert 8 < _retry_after(FakeResponse(429, { 'Retry-After': formatdate(time.time() + 10, usegmt=True) })) <= 10
+    assert _retry_after(FakeResponse(429, { 'Retry-After': 'soon' })) is None
+    assert _retry_after(FakeResponse(200)) is None
+    assert _retry_after(None) is None
+
+
+def test_hosts_are_limited_separately():
+    shared = governor()
+    assert shared.host('http://one/page') is shared.host('http://one/other')
+    assert shared.host('http://one/page') is not shared.host('http://two/page')
+
+
+def test_stream_holds_the_slot_until_the_block_ends():
+    shared = governor()
+    limiter = shared.host('http://replay/file')
+    send, _ = sender(FakeResponse(200))
+    with shared.stream('http://replay/file', send) as response:
+        assert response.status_code == 200
+        assert limiter.in_flight == 1
+        time.sleep(0.05)
+    assert limiter.in_flight == 0
+    assert limiter.failures == 0
+
+
+def test_stream_counts_a_body_read_failure():
+    shared = governor()
+    limiter = shared.host('http://replay/file')
+    send, _ = sender(FakeResponse(200))
+    with pytest.raises(requests.ConnectionError):
+        with shared.stream('http://replay/file', send):
+            raise requests.ConnectionError()
+    assert (limiter.in_flight, limiter.failures) == (0, 1)
+
+
+def test_slow_stream_body_counts_towards_latency():
+    shared = governor(latency_target=0.05)
+    limiter = shared.host('http://replay/file')
+    limit = limiter.limit
+    send, _ = sender(FakeResponse(200))
+    with shared.stream('http://replay/file', send):
+        time.sleep(0.1)
+    assert limiter.limit == limit / 2
@@ -0,0 +1,132 @@
+"""The http engine against saved document-detail and project-detail pages.
+
+The pages under fixtures/site are trimmed copies of the live markup, laid out
+as benchmarks.replay records them, so they are served by a ReplayServer.
+"""
+import os
+
+import pytest
+
+from benchmarks.replay import ReplayServer
+from conftest import FIXTURES_DIRECTORY
+from governor import RequestGovernor
+from http_engine import HttpEngine
+from pages import (FallbackReader, PageNotRendered, build_document_details, build_project_details, document_detail_url,
+    financing_rows, parse_page, project_detail_url, scrape_document_links, scrape_metadata)
+
+SITE_DIRECTORY = os.path.join(FIXTURES_DIRECTORY, 'site')
+DOCUMENTS_HOST = '/_hosts/documents.worldbank.org/en/publication/documents-reports/documentdetail'
+FILES_HOST = '/_hosts/documents1.worldbank.org/curated/en'
+
+
+def project_documents(base_url):
+    return [{
+        'document_name': 'Nigeria - Sustainable Procurement, Environmental and Social Standards Enhancement Project',
+        'date': 'May 25, 2021',
+        'report_number': 'PAD4191',
+        'document_type': 'Project Appraisal Document',
+        'document_url': f'{base_url}{DOCUMENTS_HOST}/P175987-pad'
+    }, {
+        'document_name': 'Concept Project Information Document (PID) & Annexes',
+        'date': 'February 3, 2021',
+        'report_number': 'PIDC31018',
+        'document_type': 'Project Information Document',
+        'document_url': f'{base_url}{DOCUMENTS_HOST}/P175987-pid'
+    }, {
+        'document_name': 'Stakeholder Engagement Plan (SEP)',
+        'date': 'April 12, 2021',
+        'report_number': 'SEP0001',
+        'document_type': 'Stakeholder Engagement Plan',
+        'document_url': f'{base_url}{DOCUMENTS_HOST}/P175987-sep'
+    }]
+
+
+ADDTIONAL_DETAILS = {
+    'FinancingPlan': [{ 'Financier': 'International Development Association (IDA)', 'Commitments': '80.00' }],
+    'TotalProjectFinancingTableOne': [{ 'IBRD/IDA': '80.00', 'Product Line': 'IBRD/IDA' }],
+    'TotalProjectFinancingTableTwo': [
+        { 'Investment Project Financing': '80.00', 'Lending Instrument': 'Investment Project Financing' }
+    ],
+    'SummaryStatusOfWBFinancing': [{
+        'Financier': 'IDA-68230', 'Approval Date': 'Jun 11, 2021', 'Closing Date': 'Jun 30, 2026', 'Principal': '80.00',
+        'Disbursed': '0.00', 'Repayments': '0.00', 'Interest, Charges & Fees': '0.00'
+    }],
+    'DetailedFinancialActivity': [
+        { 'Period': 'Jun 11, 2021', 'Financier': 'IDA-68230', 'Transaction Type': 'Commitment', 'Amount (US$)': '80,000,000.00' },
+        { 'Period': 'Jun 30, 2021', 'Financier': 'IDA-68230', 'Transaction Type': 'Disbursement Advance',
+            'Amount (US$)': '2,500,000.00' }
+    ]
+}
+
+
+def read_page(*path):
+    with open(os.path.join(SITE_DIRECTORY, *path), 'r') as f:
+        return f.read()
+
+
+@pytest.fixture
+def server():
+    with ReplayServer(SITE_DIRECTORY) as server:
+        yield server
+
+
+@pytest.fixture
+def engine():
+    engine = HttpEngine(governor=RequestGovernor(rate=0, retries=0))
+    yield engine
+    engine.close()
+
+
+def test_document_details_from_saved_page():
+    page = parse_page(read_page('en', 'projects-operations', 'document-detail', 'P175987'), 'http://replay')
+    # rows inside <script> aren't table rows, and the header row has no td cells
+    assert page.tables == 1
+    assert build_document_details(page.rows) == project_documents('http://replay')
+
+
+def test_project_details_from_saved_page():
+    page = parse_page(read_page('en', 'projects-operations', 'project-detail', 'P175987'))
+    assert build_project_details(financing_rows(page.rows)) == ADDTIONAL_DETAILS
+
+
+def test_scrape_metadata_over_http(server, engine):
+    project_details, document_details = scrape_metadata(engine, 'P175987', base_url=server.url)
+    assert project_details == ADDTIONAL_DETAILS
+    assert document_details == project_documents(server.url)
+
+
+def test_scrape_document_links_over_http(server, engine):
+    page_links, file_links = scrape_document_links(engine, 'P175987',
+        ['Project Appraisal Document', 'Project Information Document'], base_url=server.url)
+    assert page_links == [f'{server.url}{DOCUMENTS_HOST}/P175987-pad', f'{server.url}{DOCUMENTS_HOST}/P175987-pid']
+    assert file_links == [f'{server.url}{FILES_HOST}/P175987-{document}.{extension}'
+        for document in ('pad', 'pid') for extension in ('pdf', 'txt')]
+
+
+class FakeBrowserReader:
+    """Stands in for a BrowserReader, returning rows as TABLE_ROWS_SCRIPT would for a rendered page."""
+
+    def __init__(self, rows):
+        self.rows_read = []
+        self._rows = rows
+
+    def rows(self, url):
+        self.rows_read.append(url)
+        return self._rows
+
+
+def test_client_rendered_page_falls_back_to_browser(server, engine):
+    url = project_detail_url('P000001', server.url)
+    with pytest.raises(PageNotRendered):
+        engine.rows(url)
+
+    rendered = [[{ 'text': 'International Development Association (IDA)', 'data-th': 'Financier:', 'href': None },
+        { 'text': '80.00', 'data-th': 'Commitments:', 'href': None }]]
+    browser = FakeBrowserReader(rendered)
+    reader = FallbackReader(engine, lambda: browser)
+    assert reader.rows(url) == rendered
+    assert browser.rows_read == [url]
+
+    # pages the http engine can read don't touch the browser
+    assert build_document_details(reader.rows(document_detail_url('P175987', server.url))) == project_documents(server.url)
+    assert browser.rows_read == [url]
@@ -0,0 +1,24 @@
+from pdf_text import TEXT_ENCODING, TextCache
+from staff import DOCUMENT_ENCODING, extract_project
+
+TEXT = 'Task Team Leader: Zoë Ngozi Okonjo‑Iweala\n“Quoted” – financing ﬁgures, 北京\n'
+
+
+def test_cached_text_keeps_unicode(tmp_path):
+    cache = TextCache(str(tmp_path / '.text'))
+    with open(cache.put('ab' * 32, TEXT), encoding='utf-8') as f:
+        assert f.read() == TEXT
+
+
+def test_staff_extraction_reads_cached_text_as_utf8(tmp_path):
+    cache = TextCache(str(tmp_path / 'documents' / '.text'))
+    path = cache.put('cd' * 32, TEXT)
+    _, staff_information = extract_project('P000001', [(path, TEXT_ENCODING)])
+    assert staff_information == { 'Task Team Leader': ' Zoë Ngozi Okonjo‑Iweala' }
+
+
+def test_staff_extraction_reads_downloaded_text_as_latin1(tmp_path):
+    path = tmp_path / 'P000001_document.txt'
+    path.write_bytes('Task Team Leader: José Pérez\n'.encode('latin1'))
+    _, staff_information = extract_project('P000001', [(str(path), DOCUMENT_ENCODING)])
+    assert staff_information == { 'Task Team Leader': ' José Pérez' }
@@ -0,0 +1,73 @@
+"""--refresh against a replay server, run through main.py as a user would."""
+import os
+import re
+import sys
+import json
+import shutil
+import subprocess
+
+from api import ProjectsApi
+from benchmarks.replay import ReplayServer, save_fixture
+from conftest import FIXTURES_DIRECTORY
+from refresh import api_fields, needs_refresh
+
+MAIN = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'main.py')
+PROJECT_ID = 'P175987'
+# matches the rows of the saved document-detail page, so refreshes find nothing new to download
+PROJECT_DOCUMENTS = [
+    { 'document_name': 'Nigeria - Sustainable Procurement, Environmental and Social Standards Enhancement Project',
+        'date': 'May 25, 2021', 'report_number': 'PAD4191' },
+    { 'document_name': 'Concept Project Information Document (PID) & Annexes', 'date': 'February 3, 2021',
+        'report_number': 'PIDC31018' },
+    { 'document_name': 'Stakeholder Engagement Plan (SEP)', 'date': 'April 12, 2021', 'report_number': 'SEP0001' }
+]
+
+
+def save_api_page(directory, base_url, lastupdatedate):
+    api = ProjectsApi(f'{base_url}/api/v2/projects')
+    project = { 'id': PROJECT_ID, 'projectstatusdisplay': 'Closed', 'lastupdatedate': lastupdatedate }
+    save_fixture(directory, api.page_url(0, 1), json.dumps({ 'total': 1, 'projects': { PROJECT_ID: project } }).encode())
+
+
+def run_main(directory, server, *arguments):
+    output = subprocess.run([sys.executable, MAIN, *arguments, '--engine', 'http', '--rate', '0',
+        '--base-url', server.url, '--api-url', f'{server.url}/api/v2/projects'],
+        cwd=directory, capture_output=True, text=True, timeout=120)
+    assert output.returncode == 0, output.stderr
+    return output.stderr
+
+
+def checked(log):
+    return int(re.search(r'Checked (\d+) of', log).group(1))
+
+
+def test_api_update_date_and_status_replace_stored_ones():
+    record = { 'id': PROJECT_ID, 'projectstatusdisplay': 'Active', 'lastupdatedate': '2021-01-01', 'regionname': 'Africa' }
+    api_project = { 'projectstatusdisplay': 'Closed', 'lastupdatedate': '2022-01-01', 'regionname': 'AFR', 'project_name': 'Name' }
+    assert api_fields(record, api_project) == { 'projectstatusdisplay': 'Closed', 'lastupdatedate': '2022-01-01',
+        'project_name': 'Name' }
+
+
+def test_closed_project_is_rechecked_after_an_api_update(tmp_path):
+    site = str(tmp_path / 'site')
+    shutil.copytree(os.path.join(FIXTURES_DIRECTORY, 'site'), site)
+    workspace = tmp_path / 'workspace'
+    workspace.mkdir()
+    (workspace / 'aggregated.json').write_text(json.dumps({ PROJECT_ID: {
+        'id': PROJECT_ID, 'status': 'Closed', 'project_documents': PROJECT_DOCUMENTS } }))
+
+    with ReplayServer(site) as server:
+        save_api_page(site, server.url, '2021-06-30T00:00:00Z')
+        run_main(workspace, server, '-agg', '-a')
+        assert checked(run_main(workspace, server, '--refresh', '-a')) == 1
+        # nothing changed, so the closed project is skipped
+        assert checked(run_main(workspace, server, '--refresh', '-a')) == 0
+
+        save_api_page(site, server.url, '2022-03-31T00:00:00Z')
+        run_main(workspace, server, '-agg', '-a')
+        assert checked(run_main(workspace, server, '--refresh', '-a')) == 1
+        assert checked(run_main(workspace, server, '--refresh', '-a')) == 0
+
+
+def test_closed_project_without_a_fingerprint_is_checked():
+    assert needs_refresh({ 'status': 'Closed' }, None)
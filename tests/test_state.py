@@ -0,0 +1,38 @@
+from state import ExtractionState
+
+
+def crash(state, torn_entry):
+    """Leaves state as a killed run would: its journal not compacted, and ending in a partly written entry."""
+    state._journal.write(torn_entry)
+    state._journal.close()
+
+
+def test_entries_survive_repeated_crashes(tmp_path):
+    filepath = str(tmp_path / 'extraction_details.json')
+    state = ExtractionState(filepath)
+    state.add('documents', 'P000001')
+    crash(state, '{"stage": "documents", "project_ids": ["P0')
+
+    state = ExtractionState(filepath)
+    state.add('documents', 'P000002')
+    crash(state, '{"stage": "metadata", "proj')
+
+    state = ExtractionState(filepath)
+    assert list(state['documents']) == ['P000001', 'P000002']
+    assert list(state['metadata']) == []
+    state.close()
+    assert ExtractionState(filepath).counts() == { 'documents': 2, 'metadata': 0, 'staff_information': 0 }
+
+
+def test_counts_and_resets_replay_from_the_journal(tmp_path):
+    filepath = str(tmp_path / 'extraction_details.json')
+    state = ExtractionState(filepath)
+    state.add_many('documents', ['P000001', 'P000002', 'P000001'])
+    state.add('metadata', 'P000001')
+    state.reset('metadata')
+    state.compact()
+    state.add('staff_information', 'P000002')
+    state._journal.close()
+
+    reopened = ExtractionState(filepath)
+    assert reopened.counts() == { 'documents': 2, 'metadata': 0, 'staff_information': 1 }
@@ -0,0 +1,76 @@
+import os
+import csv
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+# the abbreviated column names (see keymap.json) start with the project id column
+ID_KEY = 'id'
+
+
+def read_rows(filepath):
+    """Yields each row of the first sheet of an .xls/.xlsx workbook, or of a csv file, as a list of values."""
+    extension = os.path.splitext(filepath)[1].lower()
+    if extension == '.csv':
+        with open(filepath, newline='', encoding='utf-8-sig') as f:
+            yield from csv.reader(f)
+    elif extension == '.xlsx':
+        import openpyxl
+        workbook = openpyxl.load_workbook(filepath, read_only=True, data_only=True)
+        try:
+            for row in workbook.worksheets[0].iter_rows(values_only=True):
+                yield ['' if value is None else value for value in row]
+        finally:
+            workbook.close()
+    else:
+        import xlrd
+        workbook = xlrd.open_workbook(filepath, on_demand=True)
+        try:
+            sheet = workbook.sheet_by_index(0)
+            for i in range(sheet.nrows):
+                yield sheet.row_values(i)
+        finally:
+            workbook.release_resources()
+
+
+def iter_records(filepath):
+    """Yields (project_id, record) for every project in a World Bank projects dump.
+
+    Dumps open with a few title rows; records start after the row of
+    abbreviated column names, which is found by its leading 'id' column.
+    """
+    rows = read_rows(filepath)
+    for row in rows:
+        if row and row[0] == ID_KEY:
+            abbr_keys = row
+            break
+    else:
+        raise ValueError(f'No column name row found in {filepath}')
+
+    for row in rows:
+        if not row or not row[0]:
+            continue
+        yield row[0], dict(zip(abbr_keys, row))
+
+
+def write_jsonl(records, filepath):
+    """Writes (project_id, record) pairs as JSON lines, atomically replacing filepath."""
+    temp_path = filepath + '.tmp'
+    count = 0
+    with open(temp_path, 'w') as f:
+        for project_id, record in records:
+            f.write(json.dumps({ 'project_id': project_id, **record }) + '\n')
+            count += 1
+    os.replace(temp_path, filepath)
+    return count
+
+
+def counted(records, every=1000):
+    """Passes records through, logging progress every so many projects."""
+    count = 0
+    for record in records:
+        yield record
+        count += 1
+        if count % every == 0:
+            logger.info('Transformed %d projects', count)
@@ -4,8 +4,9 @@
 
 from __future__ import absolute_import, division, print_function
 
+import hashlib
 import json
-import re
+import os
 
 import datasets
 
@@ -27,19 +28,121 @@ _DESCRIPTION = """World Bank Projects Dataset"""
 # Redundant but may useful in future.
 _URL = "https://frtnx.github.io/worldbank-projects/dataset"
 _URLS = {
-    'train': _URL + 'train-v1.0.json'
+    'train': _URL + '/train-v1.0.json'
 }
 
+# bytes read per chunk when streaming a json file
+_CHUNK_SIZE = 1 << 20
+# characters that can follow a json value, so one ending in the middle of the buffer is known to be whole
+_DELIMITERS = ' \t\r\n,:]}'
+
+
+def _pdf_text(filepath):
+    """Returns a pdf's text, from the cache main.py keeps in documents/.text when it has been converted."""
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    digest = digest.hexdigest()
+    cached = os.path.join(os.path.dirname(filepath), '.text', digest[:2], digest + '.txt')
+    if os.path.exists(cached):
+        # main.py's TextCache writes utf-8
+        with open(cached, encoding='utf-8', errors='replace') as f:
+            return f.read()
+
+    import pypdf
+    return '\n'.join(page.extract_text() or '' for page in pypdf.PdfReader(filepath).pages)
+
+
+def _iter_json_array(f, key='data'):
+    """Yields the elements of the array under the top-level `key` of a json file one at a time.
+
+    Only the element being decoded (plus one chunk) is held in memory, so a
+    multi-gigabyte {"data": [...]} file streams with flat memory use. The
+    top-level object is walked key by key, so a `key` nested in another value
+    or inside a string is never mistaken for it.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    eof = False
+
+    def fill():
+        # reads at least as much as is buffered, so re-decoding a large element stays linear overall
+        nonlocal buffer, position, eof
+        buffer = buffer[position:]
+        position = 0
+        chunk = f.read(max(_CHUNK_SIZE, len(buffer)))
+        eof = not chunk
+        buffer += chunk
+
+    def peek():
+        """Returns the next character that isn't whitespace, or '' at the end of the file."""
+        nonlocal position
+        while True:
+            while position < len(buffer) and buffer[position] in ' \t\r\n':
+                position += 1
+            if position < len(buffer) or eof:
+                return buffer[position:position + 1]
+            fill()
+
+    def decode():
+        """Decodes the value at position. A value is only taken once a delimiter follows it, so e.g. a number
+        cut off by a chunk boundary (`-1.5` of `-1.5e-10`) isn't returned as a whole one."""
+        nonlocal position
+        while True:
+            try:
+                value, end = decoder.raw_decode(buffer, position)
+                if end < len(buffer) and buffer[end] in _DELIMITERS or eof:
+                    position = end
+                    return value
+            except ValueError:
+                if eof:
+                    raise
+            fill()
+
+    if peek() != '{':
+        return
+    position += 1
+    while True:
+        character = peek()
+        if character == ',':
+            position += 1
+            continue
+        if character != '"':
+            return # the end of the object, without the key
+        name = decode()
+        if peek() != ':':
+            raise ValueError(f'Expected a colon after {name!r} in the top-level object')
+        position += 1
+        if peek() == '[' and name == key:
+            position += 1
+            break
+        decode() # another key's value, skipped
+
+    while True:
+        character = peek()
+        if character == ',':
+            position += 1
+            continue
+        if character in (']', ''):
+            return
+        yield decode()
+
 
 class WorldBankProjectsConfig(datasets.BuilderConfig):
     """BuilderConfig for World Bank Projects Dataset."""
 
-    def __init__(self, **kwargs):
+    def __init__(self, documents_dir=None, **kwargs):
         """BuilderConfig for World Bank Projects Dataset.
         Args:
+          documents_dir: when set, examples are read lazily from the .txt files
+            in this directory (as downloaded by main.py) instead of from json files.
+            Pdfs without a .txt version are included using their extracted text.
           **kwargs: keyword arguments forwarded to super.
         """
         super(WorldBankProjectsConfig, self).__init__(**kwargs)
+        self.documents_dir = documents_dir
 
 
 class WorldBankProjects(datasets.GeneratorBasedBuilder):
@@ -47,6 +150,14 @@ class WorldBankProjects(datasets.GeneratorBasedBuilder):
 
     VERSION = datasets.Version("1.1.0")
 
+    BUILDER_CONFIGS = [
+        WorldBankProjectsConfig(name='default', description='Documents from published json or jsonl shards'),
+        WorldBankProjectsConfig(name='documents', documents_dir='./documents',
+            description='Documents read directly from a local documents directory')
+    ]
+
+    DEFAULT_CONFIG_NAME = 'default'
+
     def _info(self):
         return datasets.DatasetInfo(
             description=_DESCRIPTION,
@@ -63,23 +174,57 @@ class WorldBankProjects(datasets.GeneratorBasedBuilder):
         )
 
     def _split_generators(self, dl_manager):
-        downloaded_files = dl_manager.download_and_extract(_URLS)
-        
+        if self.config.documents_dir:
+            filenames = os.listdir(self.config.documents_dir)
+            text_stems = set(os.path.splitext(filename)[0] for filename in filenames if filename.endswith('.txt'))
+            filepaths = sorted(
+                os.path.join(self.config.documents_dir, filename) for filename in filenames
+                if filename.endswith('.txt') or (filename.endswith('.pdf') and os.path.splitext(filename)[0] not in text_stems)
+            )
+            return [
+                datasets.SplitGenerator(name=datasets.Split.TRAIN, gen_kwargs={'filepaths': filepaths, 'documents': True})
+            ]
+
+        # each file is a shard, so datasets can generate them in parallel with num_proc
+        data_files = self.config.data_files['train'] if self.config.data_files else _URLS['train']
+        downloaded_files = dl_manager.download_and_extract(data_files)
+        if isinstance(downloaded_files, str):
+            downloaded_files = [downloaded_files]
+
         return [
-            datasets.SplitGenerator(name=datasets.Split.TRAIN, gen_kwargs={'filepath': downloaded_files['train']})
+            datasets.SplitGenerator(name=datasets.Split.TRAIN, gen_kwargs={'filepaths': downloaded_files, 'documents': False})
         ]
 
-    def _generate_examples(self, filepath):
+    def _generate_examples(self, filepaths, documents):
         """This function returns the examples in the raw (text) form."""
-        logger.info('generating examples from = %s', filepath)
-        with open(filepath, encoding="utf-8") as f:
-            worldbank_projects = json.load(f)
-            for row in worldbank_projects['data']:
-                id_ = row['project_id']
-                result = {
-                    'id': row['project_id'],
-                    'filename': row['filename'],
-                    'document_text': row['document_text']
+        for filepath in filepaths:
+            logger.info('generating examples from = %s', filepath)
+            if documents:
+                filename = os.path.basename(filepath)
+                project_id = filename[:filename.find('_')]
+                if filename.endswith('.pdf'):
+                    document_text = _pdf_text(filepath)
+                else:
+                    with open(filepath, encoding='latin1') as f:
+                        document_text = f.read()
+                yield filename, {
+                    'project_id': project_id,
+                    'filename': filename,
+                    'document_text': document_text
                 }
-
-                yield id_, result
+                continue
+
+            with open(filepath, encoding="utf-8") as f:
+                if filepath.endswith('.jsonl'):
+                    rows = (json.loads(line) for line in f if line.strip())
+                else:
+                    rows = _iter_json_array(f, 'data')
+                for row in rows:
+                    id_ = f"{row['project_id']}/{row['filename']}"
+                    result = {
+                        'project_id': row['project_id'],
+                        'filename': row['filename'],
+                        'document_text': row['document_text']
+                    }
+
+                    yield id_, result